@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Benchmarks of the dashboard against the simulated GT-1000, no unit needed.
+
+    poetry run python benchmarks/bench.py --output bench.json
+
+Measures the time from a click to its SysEx leaving the MIDI port,
+the duration of a full refresh of the pedal state and the cost of building
+and serializing the button grid of each fx_type. Results are written as JSON
+so they can be compared between releases.
+"""
+
+from dash import Dash
+import dash_bootstrap_components as dbc
+from datetime import datetime
+from importlib import metadata
+import argparse
+import json
+import platform
+import plotly
+import statistics
+import sys
+import time
+
+from gt1000pilot.api import register_routes
+from gt1000pilot.shared import (
+    gt1000,
+    state_store,
+    write_queue,
+    catalog,
+    presence,
+)
+from gt1000pilot.simulator import SimulatedGT1000
+
+# Format of the JSON output, bump when the layout of the results changes
+RESULTS_VERSION = 3
+
+
+def summarize(samples):
+    samples_ms = sorted(s * 1000 for s in samples)
+    return {
+        "count": len(samples_ms),
+        "mean_ms": statistics.mean(samples_ms),
+        "p50_ms": samples_ms[len(samples_ms) // 2],
+        "p95_ms": samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))],
+        "max_ms": samples_ms[-1],
+    }
+
+
+def wait_sent(simulator, count):
+    sent = simulator.wait_received(count, timeout=10)
+    if sent is None:
+        raise RuntimeError("Nothing received by the simulator")
+    return sent
+
+
+def bench_click_to_midi(simulator, client, iterations):
+    from gt1000pilot.pages import pages_common
+
+    results = {}
+    responses = []
+    samples = []
+    for i in range(iterations):
+        count = simulator.received + 1
+        start = time.perf_counter()
+        # What assets/blocks.js posts on a click
+        client.post("/api/dist/1/state", json={"state": ["ON", "OFF"][i % 2]})
+        responses.append(time.perf_counter() - start)
+        samples.append(wait_sent(simulator, count) - start)
+    results["api_fx_state.response"] = summarize(responses)
+    results["api_fx_state"] = summarize(samples)
+
+    samples = []
+    for i in range(iterations):
+        count = simulator.received + 1
+        start = time.perf_counter()
+        # Alternate the value, setting the same one again sends nothing
+        pages_common.handle_slider_change(10 + i % 2, "dist", 1, "slider1")
+        samples.append(wait_sent(simulator, count) - start)
+    results["handle_slider_change"] = summarize(samples)
+    return results
+
+
+def bench_refresh(iterations):
+    results = {}
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        gt1000.refresh_state()
+        samples.append(time.perf_counter() - start)
+    results["refresh_state"] = summarize(samples)
+
+    for fx_type in gt1000.fx_types:
+        samples = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            gt1000.get_all_fx_type_states(fx_type)
+            samples.append(time.perf_counter() - start)
+        results[f"get_all_fx_type_states.{fx_type}"] = summarize(samples)
+    return results
+
+
+def bench_render(iterations):
+    from gt1000pilot.pages import pages_common
+
+    results = {}
+    for fx_type in gt1000.fx_types:
+        pages_common.refresh_all_effects(fx_type)
+        blocks = pages_common.dash_effects.get().blocks(fx_type)
+        for name, func in [
+            ("build_grid", pages_common.build_grid),
+            ("generate_buttons", pages_common.generate_buttons),
+            # What each client costs once the grid is in the render cache
+            ("render_grid", pages_common.render_grid),
+        ]:
+            samples = []
+            for i in range(iterations):
+                start = time.perf_counter()
+                json.dumps(func(fx_type, blocks), cls=plotly.utils.PlotlyJSONEncoder)
+                samples.append(time.perf_counter() - start)
+            results[f"{name}.{fx_type}"] = summarize(samples)
+        payload = json.dumps(
+            pages_common.generate_buttons(fx_type), cls=plotly.utils.PlotlyJSONEncoder
+        )
+        results[f"generate_buttons.{fx_type}"]["payload_bytes"] = len(payload)
+    return results
+
+
+def package_version():
+    try:
+        return metadata.version("GT-1000PILOT")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=str, help="JSON file, stdout by default")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--refresh-iterations", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=1)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument(
+        "--model",
+        choices=["GT-1000", "GT-1000L", "GT-1000CORE"],
+        default="GT-1000",
+    )
+    args = parser.parse_args()
+
+    simulator = SimulatedGT1000(
+        model=args.model, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms
+    )
+    if not gt1000.open_simulated_ports(simulator):
+        sys.exit("Failed to open the simulated GT-1000")
+    # The pages need the state to build their layout
+    gt1000.refresh_state()
+    app = Dash(
+        "gt1000pilot.app",
+        use_pages=True,
+        pages_folder="pages",
+        external_stylesheets=[dbc.themes.BOOTSTRAP],
+    )
+    register_routes(app.server, gt1000, state_store, write_queue, catalog, presence)
+
+    results = {}
+    results.update(
+        bench_click_to_midi(simulator, app.server.test_client(), args.iterations)
+    )
+    results.update(bench_refresh(args.refresh_iterations))
+    results.update(bench_render(args.iterations))
+    simulator.close()
+    results["scheduler"] = gt1000.scheduler.stats()
+
+    out = {
+        "version": RESULTS_VERSION,
+        "package_version": package_version(),
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
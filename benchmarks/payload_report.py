@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Size of the JSON sent to the browsers for each page, no unit needed.
+
+    poetry run python benchmarks/payload_report.py --output payload.json
+
+For each page: the layout sent when navigating to it, the grid sent to a
+client that needs it rebuilt, the response to a toggle and the navigation
+bar update when the page gets selected. The callbacks are called through
+the Dash server so the sizes are the bytes of the HTTP responses.
+"""
+
+from dash import Dash, Output
+import dash
+import dash_bootstrap_components as dbc
+from datetime import datetime
+import argparse
+import json
+import plotly
+import sys
+
+from gt1000pilot.app import setup_app, page_fx_type
+from gt1000pilot.pages.pages_common import grid_outputs, refresh_paused_id
+from gt1000pilot.shared import gt1000
+from gt1000pilot.simulator import SimulatedGT1000
+
+
+def dependency(dependencies, output):
+    """The callback with output among its outputs"""
+    for callback in dependencies:
+        if output in callback["output"]:
+            return callback
+    raise KeyError(output)
+
+
+def response_size(client, callback, inputs, state, outputs, trigger=0):
+    changed = inputs[trigger]
+    body = {
+        "output": callback["output"],
+        "outputs": outputs,
+        "inputs": inputs,
+        "state": state,
+        "changedPropIds": [
+            Output(changed["id"], changed["property"]).component_id_str()
+            + f".{changed['property']}"
+        ],
+    }
+    response = client.post("/_dash-update-component", json=body)
+    if response.status_code == 204:
+        return 0
+    if response.status_code != 200:
+        raise RuntimeError(f"{callback['output']}: {response.status_code}")
+    return len(response.data)
+
+
+def grid_size(client, dependencies, fx_type):
+    blocks = gt1000.current_state[fx_type]
+    toggle_prop = grid_outputs(fx_type)[1].component_property
+    pattern_outputs = []
+    for id_type, prop in [("fx-toggle", toggle_prop), ("fx-name", "children")]:
+        pattern_outputs.append(
+            [
+                {
+                    "id": {"type": id_type, "fx_type": fx_type, "fx_id": n},
+                    "property": prop,
+                }
+                for n in range(1, len(blocks) + 1)
+            ]
+        )
+    pattern_outputs.append(
+        [
+            {
+                "id": {
+                    "type": "fx-slider",
+                    "fx_type": fx_type,
+                    "fx_id": n,
+                    "slider": s,
+                },
+                "property": "value",
+            }
+            for n, block in enumerate(blocks, start=1)
+            for s in ["slider1", "slider2"]
+            if block[s] is not None
+        ]
+    )
+    return response_size(
+        client,
+        dependency(dependencies, f"{fx_type}_buttons.children"),
+        [
+            {"id": "state-events", "property": "data", "value": None},
+            {"id": refresh_paused_id(fx_type), "property": "data", "value": False},
+        ],
+        [{"id": f"{fx_type}_rendered", "property": "data", "value": None}],
+        [{"id": f"{fx_type}_buttons", "property": "children"}]
+        + pattern_outputs
+        + [{"id": f"{fx_type}_rendered", "property": "data"}],
+        # Closing the type selection modal rebuilds the grid
+        trigger=1,
+    )
+
+
+def toggle_size(client, fx_type):
+    """The toggle changes in the browser, which only posts the new state"""
+    response = client.post(f"/api/{fx_type}/1/state", json={"state": "ON"})
+    if response.status_code != 204:
+        raise RuntimeError(f"{fx_type} toggle: {response.status_code}")
+    return len(response.data)
+
+
+def nav_size(client, dependencies, page):
+    callback = dependency(dependencies, "nav-rendered.data")
+    outputs = [
+        {"id": output.rsplit(".", 1)[0], "property": output.rsplit(".", 1)[1]}
+        for output in callback["output"].strip(".").split("...")
+    ]
+    return response_size(
+        client,
+        callback,
+        [
+            {
+                "id": "_pages_location",
+                "property": "pathname",
+                "value": page["relative_path"],
+            },
+            {"id": "state-events", "property": "data", "value": None},
+        ],
+        [
+            {
+                "id": "nav-rendered",
+                "property": "data",
+                "value": {p["name"]: "idle" for p in dash.page_registry.values()},
+            }
+        ],
+        outputs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=str, help="JSON file, stdout by default")
+    args = parser.parse_args()
+
+    simulator = SimulatedGT1000()
+    if not gt1000.open_simulated_ports(simulator):
+        sys.exit("Failed to open the simulated GT-1000")
+    gt1000.refresh_state()
+    app = Dash(
+        "gt1000pilot.app",
+        use_pages=True,
+        pages_folder="pages",
+        external_stylesheets=[dbc.themes.BOOTSTRAP],
+    )
+    setup_app(app)
+    client = app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").json
+
+    pages = {}
+    for page in dash.page_registry.values():
+        fx_type = page_fx_type(page)
+        pages[page["name"]] = {
+            "layout_bytes": len(
+                json.dumps(page["layout"], cls=plotly.utils.PlotlyJSONEncoder)
+            ),
+            "grid_bytes": grid_size(client, dependencies, fx_type),
+            "nav_bytes": nav_size(client, dependencies, page),
+        }
+    # Once everything else is measured, toggling changes the state
+    for page in dash.page_registry.values():
+        pages[page["name"]]["toggle_bytes"] = toggle_size(client, page_fx_type(page))
+    simulator.close()
+
+    out = {
+        "date": datetime.now().isoformat(),
+        "pages": pages,
+        "total": {
+            key: sum(page[key] for page in pages.values())
+            for key in ["layout_bytes", "grid_bytes", "nav_bytes", "toggle_bytes"]
+        },
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
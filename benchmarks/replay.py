@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Replay a MIDI capture through the refresh pipeline, no unit needed.
+
+    poetry run python gt1000pilot/app.py --record-midi capture.midi
+    poetry run python benchmarks/replay.py capture.midi --speed 0 --output replay.json
+
+The replies recorded from a unit are fed back at the given speed while the
+refresh thread reads the state like after opening the unit. Measures the time
+to open the unit, to read every fx_type and to replay the whole capture, and
+the duration of the refreshes of each fx_type.
+"""
+
+from datetime import datetime
+import argparse
+import json
+import platform
+import sys
+import time
+
+from gt1000pilot import metrics
+from gt1000pilot.midi_capture import ReplayedGT1000, read_capture
+from gt1000pilot.shared import gt1000, open_gt1000
+
+# Format of the JSON output, bump when the layout of the results changes
+RESULTS_VERSION = 1
+
+
+def refresh_durations():
+    results = {}
+    for (fx_type,), (_, total, count) in metrics.refresh_duration.values.items():
+        results[fx_type] = {"count": count, "mean_ms": total / count * 1000}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", type=str, help="File written by --record-midi")
+    parser.add_argument("--output", type=str, help="JSON file, stdout by default")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1,
+        help="How much faster than recorded, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--timeout-sec",
+        type=float,
+        default=600,
+        help="Give up if the capture is not replayed by then",
+    )
+    args = parser.parse_args()
+
+    try:
+        records = read_capture(args.capture)
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    replay = ReplayedGT1000(records, args.speed)
+
+    start = time.perf_counter()
+    if not open_gt1000(simulator=replay):
+        sys.exit("The capture doesn't answer the identity request")
+    opened = time.perf_counter() - start
+    deadline = start + args.timeout_sec
+    while not gt1000.synced and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    synced = time.perf_counter() - start if gt1000.synced else None
+    replay.finished.wait(max(0, deadline - time.perf_counter()))
+    replayed = time.perf_counter() - start if replay.finished.is_set() else None
+    gt1000.stop_refresh_thread()
+    replay.close()
+
+    results = {
+        "open_ms": opened * 1000,
+        "full_sync_ms": None if synced is None else synced * 1000,
+        "replay_ms": None if replayed is None else replayed * 1000,
+        "messages": len(records),
+        "delivered": replay.delivered,
+        "diverged": replay.diverged,
+        "refresh": refresh_durations(),
+        "scheduler": gt1000.scheduler.stats(),
+    }
+    out = {
+        "version": RESULTS_VERSION,
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(out, f, indent=2)
+    else:
+        json.dump(out, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+from flask_sock import Sock
+from werkzeug.exceptions import HTTPException
+import flask
+import json
+import logging
+import uuid
+
+from gt1000pilot.events import KEEPALIVE_SEC
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+FX_STATES = ["ON", "OFF"]
+SLIDERS = ["slider1", "slider2"]
+
+
+def compact_json(value):
+    return flask.Response(
+        json.dumps(value, separators=(",", ":")), mimetype="application/json"
+    )
+
+
+def stream_messages(state_store, timeout=KEEPALIVE_SEC):
+    """The messages of /api/stream: the whole state, then the values changed
+    since the previous message, or just the seq when nothing changed for
+    timeout seconds"""
+    seq, blocks = state_store.read_all()
+    yield {"seq": seq, "blocks": blocks}
+    while True:
+        new_seq, _ = state_store.wait(seq, timeout)
+        if new_seq == seq:
+            yield {"seq": seq}
+            continue
+        new_seq, blocks = state_store.read_all()
+        changed = state_store.changes_since(seq, until=new_seq)
+        seq = new_seq
+        if changed is None:
+            # Too far behind, start over
+            yield {"seq": seq, "blocks": blocks}
+            continue
+        yield {
+            "seq": seq,
+            "changes": [
+                [fx_type, index + 1, param, blocks[fx_type][index][param]]
+                for fx_type, index, param in sorted(changed)
+            ],
+        }
+
+
+def register_routes(
+    server, gt1000, state_store, write_queue, catalog, presence, websocket=True
+):
+    """The POSTs queue the MIDI write and answer at once, the changes reach
+    every client through the state store. websocket is False when the server
+    can't hand its sockets to flask-sock."""
+
+    @server.errorhandler(HTTPException)
+    def api_error(error):
+        # The pages keep the HTML errors of flask
+        if not flask.request.path.startswith("/api/"):
+            return error
+        response = compact_json({"error": error.description})
+        response.status_code = error.code
+        return response
+
+    def check_block(fx_type, fx_id):
+        if not 1 <= fx_id <= state_store.block_count(fx_type):
+            flask.abort(404, f"No block {fx_type}{fx_id}")
+
+    def request_field(name):
+        body = flask.request.get_json(silent=True)
+        if not isinstance(body, dict) or name not in body:
+            flask.abort(400, f"Missing {name}")
+        return body[name]
+
+    @server.route("/api/state")
+    def get_state():
+        seq, blocks = state_store.read_all()
+        return compact_json({"seq": seq, "blocks": blocks})
+
+    @server.route("/api/<fx_type>")
+    def get_fx_type_state(fx_type):
+        if fx_type not in gt1000.fx_types:
+            flask.abort(404, f"No fx_type {fx_type}")
+        seq, blocks = state_store.read(fx_type)
+        return compact_json({"seq": seq, "blocks": blocks})
+
+    @server.route("/api/<fx_type>/<int:fx_id>/state", methods=["POST"])
+    def set_fx_state(fx_type, fx_id):
+        check_block(fx_type, fx_id)
+        state = request_field("state")
+        if state not in FX_STATES:
+            flask.abort(400, f"state must be one of {FX_STATES}")
+        logger.info(f"{fx_type}{fx_id} {state}")
+        if not gt1000.toggle_fx_state(fx_type, fx_id, state):
+            flask.abort(500, f"Failed to write the state of {fx_type}{fx_id}")
+        state_store.set_param(fx_type, fx_id - 1, "state", state)
+        return "", 204
+
+    @server.route("/api/<fx_type>/<int:fx_id>/param", methods=["POST"])
+    def set_fx_param(fx_type, fx_id):
+        check_block(fx_type, fx_id)
+        param = request_field("param")
+        value = request_field("value")
+        _, blocks = state_store.read(fx_type)
+        block = blocks[fx_id - 1]
+        for slider in SLIDERS:
+            slider_dict = block[slider]
+            if slider_dict is not None and param in [slider, slider_dict["label"]]:
+                break
+        else:
+            flask.abort(404, f"No {param} for {fx_type}{fx_id}")
+        if (
+            not isinstance(value, int)
+            or isinstance(value, bool)
+            or not slider_dict["min"] <= value <= slider_dict["max"]
+        ):
+            flask.abort(400, f"{param} of {fx_type}{fx_id} out of range")
+        logger.info(f"{fx_type}{fx_id} {slider_dict['label']} {value}")
+        state_store.set_param(
+            fx_type, fx_id - 1, slider, {**slider_dict, "value": value}
+        )
+        # Same path as the sliders of the dashboard
+        write_queue.put((fx_type, fx_id, slider), (slider_dict["label"], value))
+        return "", 204
+
+    @server.route("/api/<fx_type>/<int:fx_id>/type", methods=["POST"])
+    def set_fx_type(fx_type, fx_id):
+        check_block(fx_type, fx_id)
+        new_type = request_field("type")
+        if new_type not in catalog.fx_types(fx_type):
+            flask.abort(400, f"No type {new_type} for {fx_type}")
+        logger.info(f"Switching {fx_type}{fx_id} to {new_type}")
+        if not gt1000.set_fx_type_type(fx_type, fx_id, new_type):
+            flask.abort(500, f"Failed to write the type of {fx_type}{fx_id}")
+        state_store.set_param(fx_type, fx_id - 1, "name", new_type)
+        return "", 204
+
+    if not websocket:
+        # The browsers ask for an upgrade, which only matches a websocket rule
+        @server.route("/api/stream", websocket=True)
+        @server.route("/api/stream")
+        def stream_unavailable():
+            flask.abort(501, "/api/stream needs --serve-mode development")
+
+        return
+
+    sock = Sock(server)
+
+    @sock.route("/api/stream")
+    def stream(ws):
+        # Counts as a client not showing any page, the unit keeps being
+        # polled for the changes it doesn't report.
+        client_id = uuid.uuid4().hex
+        presence.connect(client_id)
+        try:
+            for message in stream_messages(state_store):
+                ws.send(json.dumps(message, separators=(",", ":")))
+        finally:
+            presence.disconnect(client_id)
@@ -1,4 +1,7 @@
-from dash import Dash, Input, Output, dcc  # type: ignore
+# First, to time the imports of the other modules
+from gt1000pilot import startup
+from dash import Dash, Input, Output, State, dcc, no_update  # type: ignore
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import argparse
 import flask
@@ -12,10 +15,27 @@ import rtmidi
 from gt1000pilot.shared import (
     gt1000,
     open_gt1000,
-    menu_color1,
     logger,
     buttons_pc_height,
+    state_store,
+    write_queue,
+    presence,
+    catalog,
+    scenes,
+    state_cache,
+    midi_recorder,
+    web_server,
 )
+from gt1000pilot.api import register_routes as register_api_routes
+from gt1000pilot.catalog import register_routes as register_catalog_routes
+from gt1000pilot.events import register_routes
+from gt1000pilot.metrics import register_routes as register_metrics_routes
+from gt1000pilot.midi_capture import DEFAULT_MAX_MESSAGES, ReplayedGT1000
+from gt1000pilot.scenes import register_routes as register_scene_routes
+from gt1000pilot.serving import DEFAULT_THREADS, RESERVED_THREADS, SERVE_MODES
+from gt1000pilot.simulator import SimulatedGT1000
+from gt1000pilot.state_cache import DEFAULT_PATH as DEFAULT_STATE_CACHE_PATH
+from gt1000pilot.write_queue import DEFAULT_MAX_RATE
 from time import sleep
 
 try:
@@ -51,10 +71,59 @@ def find_default_port(ports, default_name="GT-1000"):
     return 0  # default to the first port if no match found
 
 
+# Classes of assets/style.css for the current page, a page with at least
+# one block ON, all blocks OFF
+link_classes = {
+    "selected": "nav-page nav-selected",
+    "active": "nav-page nav-active",
+    "idle": "nav-page nav-idle",
+}
+
+
+def page_fx_type(page):
+    fx_type = page["relative_path"][1:]
+    if fx_type == "":
+        fx_type = "fx"
+    return fx_type
+
+
 def launch(app):
+    setup_app(app)
+    startup.phase("server ready")
+    web_server.run(app)
+    gt1000.stop_refresh_thread()
+    state_cache.flush()
+    midi_recorder.flush()
+
+
+def setup_app(app):
+    """Layout, routes and callbacks of the app"""
+    register_routes(app.server, state_store, presence, web_server.max_streams())
+    register_catalog_routes(app.server, catalog, gt1000.fx_types)
+    # flask-sock can't get the sockets of waitress
+    register_api_routes(
+        app.server,
+        gt1000,
+        state_store,
+        write_queue,
+        catalog,
+        presence,
+        websocket=web_server.mode != "production",
+    )
+    register_scene_routes(app.server, scenes, gt1000, state_store, catalog)
+    register_metrics_routes(app, gt1000, write_queue)
     app.layout = dbc.Container(
         fluid=True,  # Ensure the container takes up the full width of the viewport
         children=[
+            # Updated by assets/events.js for each change pushed by the server
+            dcc.Store(id="state-events"),
+            # Id generated by assets/events.js, sent along the current page
+            dcc.Store(id="client-id"),
+            # Style of each link currently shown by the client
+            dcc.Store(
+                id="nav-rendered",
+                data={page["name"]: "idle" for page in dash.page_registry.values()},
+            ),
             # Top navigation bar (20% height)
             dbc.Row(
                 dbc.Col(
@@ -64,17 +133,7 @@ def launch(app):
                             id=f"page_{page['name']}",
                             children=page["name"].upper(),
                             href=page["relative_path"],
-                            style={
-                                "backgroundColor": "white",
-                                "display": "flex",
-                                "font-weight": "bold",
-                                "justify-content": "center",
-                                "align-items": "center",
-                                "textDecoration": "none",
-                                "color": "black",
-                                "padding": "0.5rem",
-                                "height": "100%",
-                            },
+                            className=link_classes["idle"],
                         )
                         for i, page in enumerate(dash.page_registry.values())
                     ],
@@ -144,57 +203,56 @@ def launch(app):
         style={"height": "100vh", "width": "100vw"},
     )
 
-    # Consolidated callback to handle all link styles
+    # Consolidated callback to handle all link classes, it only sends the
+    # links that changed.
     @app.callback(
         [
-            Output(f'page_{page["name"]}', "style")
+            Output(f'page_{page["name"]}', "className")
             for page in dash.page_registry.values()
-        ],
+        ]
+        + [Output("nav-rendered", "data")],
         Input("_pages_location", "pathname"),
+        Input("state-events", "data"),
+        State("nav-rendered", "data"),
     )
-    def update_all_link_styles(pathname):
-        styles = []
+    def update_all_link_styles(pathname, event, rendered):
+        link_states = {}
+        classes = []
         for page in dash.page_registry.values():
             if pathname == page["relative_path"]:
-                styles.append(
-                    {
-                        "backgroundColor": "black",
-                        "display": "flex",
-                        "justify-content": "center",
-                        "align-items": "center",
-                        "textDecoration": "none",
-                        "font-weight": "bold",
-                        "color": "white",
-                        "padding": "0.5rem",
-                        "height": "100%",
-                    }
-                )
+                link_state = "selected"
+            elif state_store.active_count(page_fx_type(page)) > 0:
+                link_state = "active"
             else:
-                fx_type = page["relative_path"][1:]
-                if fx_type == "":
-                    fx_type = "fx"
-                color = "white"
-                for i in gt1000.dash_effects[fx_type]:
-                    if i["state"] == "ON":
-                        color = menu_color1
-                        break
-                styles.append(
-                    {
-                        "backgroundColor": color,
-                        "display": "flex",
-                        "justify-content": "center",
-                        "align-items": "center",
-                        "textDecoration": "none",
-                        "color": "black",
-                        "font-weight": "bold",
-                        "padding": "0.5rem",
-                        "height": "100%",
-                    }
-                )
-        return styles
-
-    app.run_server(debug=False, host="0.0.0.0")
-    gt1000.stop_refresh_thread()
+                link_state = "idle"
+            link_states[page["name"]] = link_state
+            if rendered.get(page["name"]) == link_state:
+                classes.append(no_update)
+            else:
+                classes.append(link_classes[link_state])
+        if link_states == rendered:
+            raise PreventUpdate
+        return classes + [link_states]
+
+    app.clientside_callback(
+        "function (pathname) { return window.gt1000pilotClientId; }",
+        Output("client-id", "data"),
+        Input("_pages_location", "pathname"),
+    )
+
+    # Tell the refresh thread which page this client shows
+    @app.callback(
+        Input("client-id", "data"),
+        State("_pages_location", "pathname"),
+    )
+    def report_page(client_id, pathname):
+        if client_id is None:
+            return
+        for page in dash.page_registry.values():
+            if pathname == page["relative_path"]:
+                presence.set_page(client_id, page_fx_type(page))
+                return
+        presence.set_page(client_id, None)
 
 
 class AppLauncher(tk.Tk):
@@ -264,12 +322,13 @@ class AppLauncher(tk.Tk):
             self.polling_thread = threading.Thread(target=self.poll_server)
             self.polling_thread.start()
 
-            # This needs to start before the Dash app
-            if not open_gt1000(in_portname=self.midi_in_var.get(),
-                               out_portname=self.midi_out_var.get()):
-                logger.error("Failed to open GT1000 communication")
-                self.status_label.config(text="Failed to open GT-1000", fg="red")
-                return
+            # Like cli_launch(), the dashboard is served while the unit is
+            # opened and read.
+            threading.Thread(
+                target=connect_gt1000,
+                args=(self.midi_in_var.get(), self.midi_out_var.get()),
+                daemon=True,
+            ).start()
 
             # Apparently the only way to kill the GUI and dash app
             # looking for a better solution !
@@ -277,6 +336,8 @@ class AppLauncher(tk.Tk):
 
             @server.route("/shutdown", methods=["POST"])
             def shutdown():
+                if web_server.shutdown():
+                    return "", 204
                 pid = os.getpid()
                 os.kill(pid, signal.SIGINT)
 
@@ -318,10 +379,22 @@ class AppLauncher(tk.Tk):
         self.destroy()
 
 
-def cli_launch(in_portname, out_portname):
-    while not open_gt1000(in_portname=in_portname, out_portname=out_portname):
+def connect_gt1000(in_portname, out_portname, simulator=None):
+    while not open_gt1000(
+        in_portname=in_portname, out_portname=out_portname, simulator=simulator
+    ):
         logger.error("Failed to open GT1000 communication")
         sleep(1)
+
+
+def cli_launch(in_portname, out_portname, simulator=None):
+    # The dashboard is served while the unit is opened and read, the pages
+    # fill in as their blocks are read.
+    threading.Thread(
+        target=connect_gt1000,
+        args=(in_portname, out_portname, simulator),
+        daemon=True,
+    ).start()
     app = Dash(
         __name__,
         use_pages=True,
@@ -331,6 +404,17 @@ def cli_launch(in_portname, out_portname):
     launch(app)
 
 
+def positive_float(value):
+    """argparse type of the rates"""
+    try:
+        value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+    if value <= 0:
+        raise argparse.ArgumentTypeError(f"{value} is not positive")
+    return value
+
+
 def gui_launch():
     print("Launching application...")
     midi_in, midi_out = get_available_ports()
@@ -346,7 +430,93 @@ if __name__ == "__main__":
     parser.add_argument("--list-midi-ports", action="store_true")
     parser.add_argument("--input-midi-port", type=str, required=False)
     parser.add_argument("--output-midi-port", type=str, required=False)
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="Use an in-memory GT-1000 instead of a unit on a MIDI port",
+    )
+    parser.add_argument(
+        "--simulate-model",
+        choices=["GT-1000", "GT-1000L", "GT-1000CORE"],
+        default="GT-1000",
+    )
+    parser.add_argument("--simulate-latency-ms", type=float, default=0)
+    parser.add_argument("--simulate-jitter-ms", type=float, default=0)
+    parser.add_argument(
+        "--record-midi",
+        type=str,
+        required=False,
+        help="File the MIDI messages sent and received are logged to",
+    )
+    parser.add_argument(
+        "--record-max-messages",
+        type=int,
+        default=DEFAULT_MAX_MESSAGES,
+        help="Messages kept in memory until they are saved, the oldest are "
+        "dropped beyond that",
+    )
+    parser.add_argument(
+        "--replay-midi",
+        type=str,
+        required=False,
+        help="Use the replies of a file written by --record-midi instead of a "
+        "unit on a MIDI port",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1,
+        help="How much faster than recorded the replies are replayed, 0 for as "
+        "fast as possible",
+    )
+    parser.add_argument(
+        "--max-write-rate",
+        type=positive_float,
+        default=DEFAULT_MAX_RATE,
+        help="Maximum number of slider values sent to the unit per second",
+    )
+    parser.add_argument(
+        "--scenes",
+        type=str,
+        required=False,
+        help="JSON file the scenes are loaded from and saved to",
+    )
+    parser.add_argument(
+        "--state-cache",
+        type=str,
+        default=DEFAULT_STATE_CACHE_PATH,
+        help="File the state is saved to, to show it right away on the next "
+        "start, empty to disable",
+    )
+    parser.add_argument(
+        "--serve-mode",
+        choices=SERVE_MODES,
+        default="development",
+        help="production serves with waitress, gzip and cache headers",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=DEFAULT_THREADS,
+        help="Threads of the production server, each client keeps one busy "
+        f"and {RESERVED_THREADS} are left to the callbacks",
+    )
+    parser.add_argument(
+        "--keep-alive-sec",
+        type=int,
+        required=False,
+        help="How long the production server keeps idle connections open",
+    )
     args = parser.parse_args()
+    startup.phase("imports")
+    web_server.configure(args.serve_mode, args.threads, args.keep_alive_sec)
+    write_queue.set_max_rate(args.max_write_rate)
+    if args.scenes:
+        scenes.load(args.scenes)
+    if args.state_cache:
+        state_cache.start(args.state_cache)
+    if args.record_midi:
+        midi_recorder.start(args.record_midi, args.record_max_messages)
 
     if args.list_midi_ports:
         midi_in, midi_out = get_available_ports()
@@ -354,7 +524,17 @@ if __name__ == "__main__":
         print(f"Available midi output ports: {midi_out}")
         sys.exit(0)
 
-    if cli_only or args.gui is False:
+    if args.simulate:
+        simulator = SimulatedGT1000(
+            model=args.simulate_model,
+            latency_ms=args.simulate_latency_ms,
+            jitter_ms=args.simulate_jitter_ms,
+        )
+        cli_launch(None, None, simulator=simulator)
+    elif args.replay_midi:
+        replay = ReplayedGT1000.load(args.replay_midi, args.replay_speed)
+        cli_launch(None, None, simulator=replay)
+    elif cli_only or args.gui is False:
         cli_launch(args.input_midi_port, args.output_midi_port)
     else:
         gui_launch()
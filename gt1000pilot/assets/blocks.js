@@ -0,0 +1,44 @@
+// Toggles of the blocks: the color changes on the click, the new state is
+// posted to the API which queues the MIDI write and answers at once.
+(function () {
+    // Same classes as toggle_class() in pages_common.py
+    var classes = {ON: 'fx-toggle fx-on', OFF: 'fx-toggle fx-off'};
+
+    function revert(block, className) {
+        // The page may have changed since the click
+        try {
+            window.dash_clientside.set_props(
+                {type: block.type, fx_type: block.fx_type, fx_id: block.fx_id},
+                {className: className}
+            );
+        } catch (error) {
+            console.error(error);
+        }
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        blocks: {
+            toggle: function (nClicks, className) {
+                var block = window.dash_clientside.callback_context.triggered_id;
+                var state = className === classes.ON ? 'OFF' : 'ON';
+                fetch(
+                    '/api/' + encodeURIComponent(block.fx_type) + '/' +
+                        block.fx_id + '/state',
+                    {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({state: state}),
+                        keepalive: true
+                    }
+                ).then(function (response) {
+                    if (!response.ok) {
+                        revert(block, className);
+                    }
+                }).catch(function () {
+                    revert(block, className);
+                });
+                return classes[state];
+            }
+        }
+    });
+})();
@@ -0,0 +1,27 @@
+// Receive the state changes pushed by the server (Server-Sent Events) and
+// hand them to the Dash callbacks through the "state-events" store.
+// The client id tells the server which page this client shows.
+window.gt1000pilotClientId =
+    Date.now().toString(36) + Math.random().toString(36).slice(2);
+
+// The server refuses the stream while all its threads are busy, the browser
+// doesn't retry then
+var EVENTS_RETRY_MS = 10000;
+
+function openEvents() {
+    var source = new EventSource(
+        '/events?client=' + encodeURIComponent(window.gt1000pilotClientId)
+    );
+    source.onmessage = function (event) {
+        window.dash_clientside.set_props('state-events', {
+            data: JSON.parse(event.data)
+        });
+    };
+    source.onerror = function () {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(openEvents, EVENTS_RETRY_MS);
+        }
+    };
+}
+
+window.addEventListener('load', openEvents);
@@ -0,0 +1,77 @@
+// Type selection modal of the blocks. The effect types of each fx_type are
+// fetched once from /catalog (cached by the browser too) and the grid of
+// buttons is built here, only the type picked goes to the server.
+(function () {
+    // fx_type -> Promise of its effect types
+    var catalogs = {};
+
+    function catalog(fxType) {
+        if (!(fxType in catalogs)) {
+            catalogs[fxType] = fetch(
+                '/catalog/' + encodeURIComponent(fxType) + '.json'
+            ).then(function (response) {
+                if (!response.ok) {
+                    throw new Error('Catalog of ' + fxType + ': ' + response.status);
+                }
+                return response.json();
+            }).then(function (body) {
+                return body.types;
+            }).catch(function (error) {
+                // Try again the next time the modal opens
+                delete catalogs[fxType];
+                throw error;
+            });
+        }
+        return catalogs[fxType];
+    }
+
+    function component(type, props) {
+        return {namespace: 'dash_bootstrap_components', type: type, props: props};
+    }
+
+    // Same ids as effect_button_id() in pages_common.py
+    function typeGrid(block, types, selected) {
+        return component('Row', {
+            className: 'g-2 fx-type-grid',
+            children: types.map(function (label) {
+                return component('Col', {
+                    width: 3,
+                    children: component('Button', {
+                        id: {
+                            type: 'effect-button',
+                            fx_type: block.fx_type,
+                            fx_id: block.fx_id,
+                            label: label
+                        },
+                        children: label,
+                        color: label === selected ? 'secondary' : 'primary',
+                        className: 'fx-type-button',
+                        n_clicks: 0
+                    })
+                });
+            })
+        });
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        type_picker: {
+            // Returns is_open, the buttons of the modal and the type picked
+            update: function (moreClicks, closeClicks, typeClicks, name) {
+                var noUpdate = window.dash_clientside.no_update;
+                var block = window.dash_clientside.callback_context.triggered_id;
+                if (block.type === 'fx-more' && moreClicks) {
+                    return catalog(block.fx_type).then(function (types) {
+                        return [true, typeGrid(block, types, name), noUpdate];
+                    });
+                }
+                if (block.type === 'fx-close' && closeClicks) {
+                    return [false, [], noUpdate];
+                }
+                if (block.type === 'effect-button' && typeClicks.some(Boolean)) {
+                    return [false, [], block.label];
+                }
+                return [noUpdate, noUpdate, noUpdate];
+            }
+        }
+    });
+})();
@@ -0,0 +1,58 @@
+import flask
+import json
+import threading
+
+# The effect types only depend on the tables shipped with pygt1000, the
+# browsers revalidate them with their ETag once a day.
+CACHE_MAX_AGE_SEC = 24 * 3600
+
+
+class Catalog:
+    """The effect types each fx_type can be switched to, computed once"""
+
+    def __init__(self, gt1000):
+        self.gt1000 = gt1000
+        self.lock = threading.Lock()
+        # fx_type -> (types, JSON sent to the browsers)
+        self.entries = {}
+
+    def fx_types(self, fx_type):
+        return self.entry(fx_type)[0]
+
+    def body(self, fx_type):
+        return self.entry(fx_type)[1]
+
+    def entry(self, fx_type):
+        with self.lock:
+            if fx_type not in self.entries:
+                # None when pygt1000 has no table for fx_type
+                types = self.gt1000.get_all_fx_types(fx_type) or []
+                self._add_entry(fx_type, types)
+            return self.entries[fx_type]
+
+    def _add_entry(self, fx_type, types):
+        types = tuple(types)
+        body = json.dumps({"fx_type": fx_type, "types": types}, separators=(",", ":"))
+        self.entries[fx_type] = (types, body)
+
+    def export(self, fx_types):
+        """Return fx_type -> effect types for fx_types"""
+        return {fx_type: list(self.fx_types(fx_type)) for fx_type in fx_types}
+
+    def preload(self, catalogs):
+        """Use the effect types of an export() instead of computing them"""
+        with self.lock:
+            for fx_type, types in catalogs.items():
+                self._add_entry(fx_type, types)
+
+
+def register_routes(server, catalog, fx_types):
+    @server.route("/catalog/<fx_type>.json")
+    def fx_type_catalog(fx_type):
+        if fx_type not in fx_types:
+            flask.abort(404)
+        response = flask.Response(catalog.body(fx_type), mimetype="application/json")
+        response.cache_control.public = True
+        response.cache_control.max_age = CACHE_MAX_AGE_SEC
+        response.add_etag()
+        return response.make_conditional(flask.request)
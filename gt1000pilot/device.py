@@ -0,0 +1,601 @@
+from pygt1000 import GT1000
+from pygt1000.constants import FX_TO_TABLE_SUFFIX, PROGRAM_CHANGE_OFFSET
+from pygt1000.gt1000 import (
+    MidiInputHandler,
+    REFRESH_STATE_POLL_RATE_SEC,
+    RETRY_COUNT,
+    SLEEP_WAIT_SEC,
+)
+from datetime import datetime
+import copy
+import logging
+import threading
+import time
+
+from gt1000pilot import metrics, startup
+from gt1000pilot.midi_capture import IN, OUT
+from gt1000pilot.midi_scheduler import MidiScheduler, USER, BACKGROUND
+from gt1000pilot.patch_cache import PatchCache
+from gt1000pilot.read_planner import BulkRead, MAX_READS_IN_FLIGHT, plan_reads
+from gt1000pilot.sysex import (
+    DT1,
+    address_to_int,
+    int_to_address,
+    merge_dt1,
+    parse_message,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# MIDI Program Change status byte, the low nibble is the channel
+PROGRAM_CHANGE_STATUS = 0xC0
+
+# The patch number at PROGRAM_CHANGE_OFFSET is 2 bytes of 7 bits
+PATCH_NUMBER_LEN = [0x00, 0x00, 0x00, 0x02]
+
+# Passes of read_blocks() before giving up on planning, the first one reads
+# SW and TYPE, the second one the sliders that depend on TYPE.
+MAX_READ_PASSES = 4
+
+
+# Library calls building the DT1 of each kind of write of send_batch()
+BATCH_WRITES = {
+    "state": GT1000.toggle_fx_state,
+    "type": GT1000.set_fx_type_type,
+    "param": GT1000.set_fx_value,
+}
+
+
+class PilotGT1000(GT1000):
+    """GT1000 that tells the dashboard when the known state of a block changes
+    and runs all its MIDI exchanges on a single scheduler thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.state_listeners = []
+        # SimulatedGT1000 used instead of the MIDI ports
+        self.simulator = None
+        # Reads are background jobs, writes from the dashboard user jobs
+        self.scheduler = MidiScheduler()
+        # Signaled when a reply is received, replaces polling received_data
+        self.recv_cond = threading.Condition()
+        # poll_interval(fx_type) returns how long the refresh thread can wait
+        # before reading fx_type again, None to only refresh on demand
+        self.poll_interval = None
+        # fx_type -> when its blocks were last read
+        self.last_poll = {}
+        # Number of the patch selected on the unit, None until known
+        self.current_patch = None
+        # Blocks of the last patches used, shown while a new patch is read
+        self.patch_cache = PatchCache()
+        # RQ1 ranges waiting for their DT1, protected by recv_cond
+        self.bulk_reads = []
+        # Memory image read_blocks() serves the reads of its thread from
+        self.bulk = threading.local()
+        # Messages of the batch being built by send_batch() on its thread
+        self.batch = threading.local()
+        # Software revision levels of the identity reply, they change with
+        # the firmware
+        self.software_revision = None
+        # Set once every fx_type was read from the unit
+        self.synced = False
+        # MidiRecorder logging the messages sent and received, if any
+        self.recorder = None
+
+    # pygt1000 decodes the fx blocks with the names of current_fx_names,
+    # while read_blocks() plans its reads they are a copy of its thread
+    @property
+    def current_fx_names(self):
+        fx_names = getattr(self.bulk, "fx_names", None)
+        return self._current_fx_names if fx_names is None else fx_names
+
+    @current_fx_names.setter
+    def current_fx_names(self, fx_names):
+        self._current_fx_names = fx_names
+
+    def add_state_listener(self, listener):
+        """listener(fx_type, blocks, read_ts) is called from the MIDI threads
+        with a copy of the blocks of fx_type every time they are updated"""
+        self.state_listeners.append(listener)
+
+    def open_simulated_ports(self, simulator):
+        """Talk to a SimulatedGT1000 instead of a unit on a MIDI port"""
+        self.simulator = simulator
+        return self.open_ports("simulated", "simulated")
+
+    def open_ports(self, in_portname=None, out_portname=None):
+        if self.simulator is None:
+            return super().open_ports(in_portname, out_portname)
+        logger.info("Opening simulated GT-1000")
+        self.in_portname = in_portname
+        self.out_portname = out_portname
+        self.midi_out = self.simulator.midi_out
+        self.midi_in = self.simulator.midi_in
+        self.midi_in.ignore_types(sysex=False)
+        self.midi_in.set_callback(MidiInputHandler(in_portname), self)
+        return self.open_editor_mode()
+
+    def open_editor_mode(self):
+        if not super().open_editor_mode():
+            return False
+        self.read_current_patch()
+        return True
+
+    def read_current_patch(self):
+        """Read the number of the patch selected on the unit"""
+        data = self.fetch_mem(PROGRAM_CHANGE_OFFSET, PATCH_NUMBER_LEN)
+        if data is None or len(data) != 2:
+            return
+        with self.state_lock:
+            self.current_patch = (data[0] << 7) | data[1]
+        logger.info(f"Current patch {self.current_patch}")
+
+    def _msg_identity_reply(self, message):
+        if not super()._msg_identity_reply(message):
+            return False
+        self.software_revision = list(message[10:14])
+        return True
+
+    def identity(self):
+        """Model and firmware of the unit, None until it is opened"""
+        if self.software_revision is None:
+            return None
+        # Not set by pygt1000 for the models it doesn't know
+        return [getattr(self, "model", None), self.software_revision]
+
+    def option_range(self, fx_type, fx_id, option, fx_name=None):
+        """[min, max] of an option of a block in the pygt1000 tables, None
+        if it has no such option. The options of the fx blocks depend on
+        their effect type, fx_name, the current one by default."""
+        fx_type, fx_id = self._normalize_fx_block(fx_type, fx_id)
+        if fx_type == "fx":
+            if fx_name is None:
+                fx_name = self.current_fx_names.get(fx_id)
+            if fx_name not in FX_TO_TABLE_SUFFIX:
+                return None
+            start_section = self._get_fx_start_section(fx_id, fx_name)
+            block = f"{fx_type}{fx_id}{FX_TO_TABLE_SUFFIX[fx_name]}"
+        else:
+            start_section = self._get_start_section(fx_type, str(fx_id))
+            block = f"{fx_type}{fx_id}"
+        section = self.tables["base-addresses"][start_section]
+        block_entry = self.tables[section["table"]].get(block)
+        if block_entry is None:
+            return None
+        option_entry = self.tables[block_entry["table"]].get(option)
+        if option_entry is None:
+            return None
+        return option_entry["value_range"]
+
+    def send_message(self, message, offset=None):
+        messages = getattr(self.batch, "messages", None)
+        if messages is not None:
+            # Building a batch, see send_batch()
+            messages.append(message)
+            return
+        self.scheduler.call(USER, self._send_midi, message, offset)
+
+    def _send_midi(self, message, offset=None):
+        super().send_message(message, offset)
+        if self.recorder is not None:
+            self.recorder.record(OUT, message)
+
+    def fetch_mem(self, offset, length, override_checksum=None):
+        image = getattr(self.bulk, "image", None)
+        if image is not None:
+            # Planning a bulk read, see read_blocks()
+            start = address_to_int(offset)
+            addresses = range(start, start + address_to_int(length))
+            if all(address in image for address in addresses):
+                return [image[address] for address in addresses]
+            self.bulk.misses.update(addresses)
+            return [0] * len(addresses)
+        return self.scheduler.call(
+            BACKGROUND, self._fetch_mem, offset, length, override_checksum
+        )
+
+    def _fetch_mem(self, offset, length, override_checksum):
+        start = time.monotonic()
+        data = super().fetch_mem(offset, length, override_checksum)
+        if data is None:
+            metrics.replies_timed_out.inc(read="single")
+        else:
+            metrics.sysex_round_trip.observe(time.monotonic() - start, read="single")
+        return data
+
+    def wait_recv_data(self, offset=None):
+        deadline = time.monotonic() + RETRY_COUNT * SLEEP_WAIT_SEC
+        with self.recv_cond:
+            while True:
+                with self.data_semaphore:
+                    data = self.received_data[str(offset)]
+                if data is not None:
+                    return data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.recv_cond.wait(remaining)
+
+    def process_received_message(self, message):
+        if self.recorder is not None:
+            self.recorder.record(IN, message)
+        if len(message) == 2 and message[0] & 0xF0 == PROGRAM_CHANGE_STATUS:
+            # Sent by the unit when the patch changes, with or without editor
+            # mode, the DT1 of the editor mode is handled by the library.
+            # The program doesn't tell the bank, nothing is cached until the
+            # refresh reads the patch number.
+            logger.info(f"Program change {message[1]}")
+            with self.state_lock:
+                self.current_patch = None
+            self.queue_refresh({"type": "full"})
+            return
+        if self.bulk_reads and self._receive_bulk_read(message):
+            return
+        super().process_received_message(message)
+        with self.recv_cond:
+            self.recv_cond.notify_all()
+
+    # The dashboard doesn't wait for its writes, they are sent ahead of the
+    # reads queued by the refresh. They return False when the DT1 can't be
+    # built, nothing is sent then.
+    def toggle_fx_state(self, fx_type, fx_id, state):
+        return self._queue_write("state", fx_type, fx_id, state)
+
+    def set_fx_value(self, fx_type, fx_id, option, value):
+        return self._queue_write("param", fx_type, fx_id, option, value)
+
+    def set_fx_type_type(self, fx_type, fx_id, new_type):
+        return self._queue_write("type", fx_type, fx_id, new_type)
+
+    def _queue_write(self, kind, fx_type, fx_id, *args):
+        """Build the DT1 of a write on the calling thread, send it from a
+        user job"""
+        self.batch.messages = []
+        try:
+            BATCH_WRITES[kind](self, fx_type, fx_id, *args)
+            messages = self.batch.messages
+        except Exception:
+            # Catch all, the caller reports the failed write
+            logger.exception(f"Failed to build {kind} {fx_type}{fx_id} {args}")
+            return False
+        finally:
+            self.batch.messages = None
+        if not messages:
+            return False
+        self.scheduler.submit(USER, self._send_messages, messages)
+        return True
+
+    def _send_messages(self, messages):
+        for message in messages:
+            self._send_midi(message)
+
+    def send_batch(self, writes):
+        """Send several writes back to back in a single user job, the DT1
+        to contiguous addresses merged. writes are ("state", fx_type, fx_id,
+        state), ("type", fx_type, fx_id, new_type) or ("param", fx_type,
+        fx_id, option, value), the types are written first so the options
+        of the fx blocks are looked up in their new table."""
+        return self.scheduler.submit(USER, self._send_batch, writes)
+
+    def _send_batch(self, writes):
+        writes = sorted(writes, key=lambda write: write[0] != "type")
+        self.batch.messages = []
+        try:
+            for kind, fx_type, fx_id, *args in writes:
+                try:
+                    BATCH_WRITES[kind](self, fx_type, fx_id, *args)
+                except Exception:
+                    # Catch all to send the other writes
+                    logger.exception(f"Failed to build {kind} {fx_type}{fx_id} {args}")
+                    continue
+                if kind == "type" and fx_type == "fx":
+                    _, fx_id = self._normalize_fx_block(fx_type, fx_id)
+                    with self.state_lock:
+                        self.current_fx_names[fx_id] = args[0]
+            messages = merge_dt1(self.batch.messages)
+        finally:
+            self.batch.messages = None
+        self._send_messages(messages)
+        logger.info(f"Sent {len(writes)} writes in {len(messages)} messages")
+        # The sliders shown depend on the type
+        for kind, fx_type, fx_id, *_ in writes:
+            if kind == "type":
+                self.queue_refresh(
+                    {"type": "block", "fx_type": fx_type, "index": int(fx_id) - 1}
+                )
+        return len(messages)
+
+    def _sync_timestamps(self):
+        with self.state_lock:
+            return dict(self.current_state["last_sync_ts"])
+
+    def _notify_changes(self, before):
+        # Every path that updates current_state also bumps last_sync_ts for
+        # the fx_type it touched, so compare them to find what changed.
+        after = self._sync_timestamps()
+        for fx_type, ts in after.items():
+            if before.get(fx_type) != ts:
+                self._notify_state_changed(fx_type, ts)
+
+    def _notify_state_changed(self, fx_type, read_ts):
+        with self.state_lock:
+            blocks = copy.deepcopy(self.current_state[fx_type])
+            patch = self.current_patch
+        if patch is not None:
+            self.patch_cache.update(patch, fx_type, copy.deepcopy(blocks))
+        for listener in self.state_listeners:
+            try:
+                listener(fx_type, blocks, read_ts)
+            except Exception:
+                logger.exception(f"State listener failed for {fx_type}")
+
+    def refresh_state(self):
+        if self.stop:
+            return
+        logger.info("Refresh state")
+        if self.current_patch is None:
+            self.read_current_patch()
+        self._refresh_fx_types(self.fx_types)
+
+    def sync_state(self):
+        """First read of the unit, one fx_type at a time and the pages shown
+        first, each one reaches the dashboard as soon as it is read"""
+        remaining = list(self.fx_types)
+        while remaining and not self.stop:
+            if self.poll_interval is not None:
+                # Clients may connect while we sync
+                remaining.sort(key=self.poll_interval)
+            self._refresh_fx_types([remaining.pop(0)])
+            startup.phase("first block")
+        if not remaining:
+            self.synced = True
+        startup.phase("full sync")
+
+    def load_patches(self, patches, current_patch):
+        """Fill the patch cache with the (patch, blocks) of a previous run
+        and show the blocks of current_patch until the unit is read"""
+        for patch, blocks in patches:
+            for fx_type, fx_type_blocks in blocks.items():
+                if fx_type in self.fx_types:
+                    self.patch_cache.update(patch, fx_type, fx_type_blocks)
+        self._apply_cached_patch(current_patch)
+
+    def _refresh_fx_types(self, fx_types):
+        now = datetime.now()
+        patch = self.current_patch
+        start = time.monotonic()
+        states = self.read_blocks(fx_types)
+        duration = time.monotonic() - start
+        for fx_type in fx_types:
+            metrics.refresh_duration.observe(duration, fx_type=fx_type)
+        with self.state_lock:
+            # Read across a patch change, the refresh it queued reads it again
+            if patch != self.current_patch:
+                return
+            for fx_type, blocks in states.items():
+                self.current_state[fx_type] = blocks
+                self.current_state["last_sync_ts"][fx_type] = now
+        for fx_type in states:
+            self.last_poll[fx_type] = now
+            self._notify_state_changed(fx_type, now)
+
+    def read_blocks(self, fx_types):
+        """Return fx_type -> blocks for fx_types, read with as few RQ1 as
+        possible.
+
+        The library reads the parameters one by one, and which ones depends
+        on the values read before (the sliders of fx blocks depend on their
+        TYPE). Its reads are served from an image of the unit memory, the
+        addresses missing from it are read in bulk, until a pass finds
+        everything it needs in the image.
+        """
+        image = {}
+        with self.state_lock:
+            known_fx_names = dict(self._current_fx_names)
+        for _ in range(MAX_READ_PASSES):
+            self.bulk.image = image
+            self.bulk.misses = set()
+            # The names decoded from placeholders stay on this thread
+            self.bulk.fx_names = dict(known_fx_names)
+            try:
+                states = {
+                    fx_type: self.get_all_fx_type_states(fx_type)
+                    for fx_type in fx_types
+                }
+            finally:
+                self.bulk.image = None
+                fx_names, self.bulk.fx_names = self.bulk.fx_names, None
+            if not self.bulk.misses:
+                self._update_fx_names(known_fx_names, fx_names)
+                return states
+            ranges = plan_reads(self.bulk.misses)
+            for i in range(0, len(ranges), MAX_READS_IN_FLIGHT):
+                window = ranges[i : i + MAX_READS_IN_FLIGHT]
+                values = self.read_ranges(window)
+                if values is None:
+                    logger.warning("Bulk read failed, reading one by one")
+                    return self._read_blocks_one_by_one(fx_types)
+                for (start, size), data in zip(window, values):
+                    image.update(zip(range(start, start + size), data))
+        logger.warning("Bulk read incomplete, reading one by one")
+        return self._read_blocks_one_by_one(fx_types)
+
+    def _update_fx_names(self, known_fx_names, fx_names):
+        """Keep the names read from the unit, unless the dashboard changed
+        them while they were read"""
+        with self.state_lock:
+            for fx_id, name in fx_names.items():
+                if self._current_fx_names.get(fx_id) == known_fx_names.get(fx_id):
+                    self._current_fx_names[fx_id] = name
+
+    def _read_blocks_one_by_one(self, fx_types):
+        return {fx_type: self.get_all_fx_type_states(fx_type) for fx_type in fx_types}
+
+    def read_ranges(self, ranges):
+        """Read the (start, size) ranges of 7-bit packed addresses, sending
+        all the RQ1 before waiting for the replies. Return the bytes of each
+        range, None if one of them is not received."""
+        return self.scheduler.call(BACKGROUND, self._read_ranges, ranges)
+
+    def _read_ranges(self, ranges):
+        bulk_reads = [BulkRead(start, size) for start, size in ranges]
+        with self.recv_cond:
+            self.bulk_reads.extend(bulk_reads)
+        start = time.monotonic()
+        try:
+            for bulk_read in bulk_reads:
+                self._send_midi(
+                    self.build_rq_message(
+                        int_to_address(bulk_read.start), int_to_address(bulk_read.size)
+                    )
+                )
+            with self.recv_cond:
+                if not self.recv_cond.wait_for(
+                    lambda: all(bulk_read.complete() for bulk_read in bulk_reads),
+                    RETRY_COUNT * SLEEP_WAIT_SEC,
+                ):
+                    metrics.replies_timed_out.inc(read="bulk")
+                    return None
+        finally:
+            with self.recv_cond:
+                for bulk_read in bulk_reads:
+                    self.bulk_reads.remove(bulk_read)
+        metrics.sysex_round_trip.observe(time.monotonic() - start, read="bulk")
+        return [bulk_read.values() for bulk_read in bulk_reads]
+
+    def _receive_bulk_read(self, message):
+        parsed = parse_message(message)
+        if parsed is None:
+            return False
+        command, device_id, address, data = parsed
+        if command != DT1 or device_id != self.device_id:
+            return False
+        with self.recv_cond:
+            kept = False
+            for bulk_read in self.bulk_reads:
+                kept |= bulk_read.add(address_to_int(address), data)
+            if kept:
+                self.recv_cond.notify_all()
+            return kept
+
+    def _poll_due_fx_types(self):
+        """Read again the fx_types not read for longer than poll_interval"""
+        if self.poll_interval is None:
+            return
+        due = []
+        for fx_type in self.fx_types:
+            last = self.last_poll.get(fx_type)
+            interval = self.poll_interval(fx_type)
+            if last is None or (datetime.now() - last).total_seconds() >= interval:
+                due.append(fx_type)
+        # Queued refreshes go first
+        if due and not self.stop and not self.refresh_event.is_set():
+            logger.debug(f"Poll state for {due}")
+            self._refresh_fx_types(due)
+
+    def refresh_state_thread(self):
+        while not self.stop:
+            self.refresh_event.wait(REFRESH_STATE_POLL_RATE_SEC / 10)
+            if not self.refresh_event.is_set():
+                self._poll_due_fx_types()
+                continue
+            self.refresh_event.clear()
+            with self.state_lock:
+                if len(self.refresh_queue) < 1:
+                    logger.error("Refresh started, but refresh queue empty")
+                    continue
+                task = self.refresh_queue.pop(0)
+                if task["type"] == "full":
+                    # Reading the whole patch covers everything queued before
+                    self.refresh_queue.clear()
+                if len(self.refresh_queue) > 0:
+                    self.refresh_event.set()
+            if task["type"] == "full":
+                self.refresh_state()
+            elif task["type"] == "sync":
+                self.sync_state()
+            elif task["type"] == "sliders":
+                self._refresh_sliders(task["fx_type"], task["fx_id"])
+            elif task["type"] == "block":
+                self._refresh_block(task["fx_type"], task["index"])
+            else:
+                logger.error(f"Unknown refresh task {task}")
+
+    def queue_refresh(self, task):
+        """Ask the refresh thread to read task again, see refresh_queue"""
+        with self.state_lock:
+            if task in self.refresh_queue:
+                return
+            self.refresh_queue.append(task)
+        self.refresh_event.set()
+
+    def _refresh_block(self, fx_type, index):
+        now = datetime.now()
+        patch = self.current_patch
+        block = self._get_one_fx_state(*self._normalize_fx_block(fx_type, index + 1))
+        with self.state_lock:
+            if fx_type not in self.current_state or patch != self.current_patch:
+                return
+            self.current_state[fx_type][index] = block
+            self.current_state["last_sync_ts"][fx_type] = now
+        self._notify_state_changed(fx_type, now)
+
+    def _refresh_sliders(self, fx_type, fx_id):
+        now = datetime.now()
+        slider1, slider2 = self._get_sliders(fx_type, fx_id, None)
+        with self.state_lock:
+            for fx in self.current_state[fx_type]:
+                if str(fx["fx_id"]) == str(fx_id):
+                    fx["slider1"] = slider1
+                    fx["slider2"] = slider2
+                    break
+            self.current_state["last_sync_ts"][fx_type] = now
+        self._notify_state_changed(fx_type, now)
+
+    def _process_data_from_unit(self, received_offset, received_data):
+        if received_offset == PROGRAM_CHANGE_OFFSET and len(received_data) == 2:
+            self._apply_cached_patch((received_data[0] << 7) | received_data[1])
+        elif len(received_data) > 1:
+            self._queue_block_refreshes(received_offset, received_data)
+            return
+        before = self._sync_timestamps()
+        super()._process_data_from_unit(received_offset, received_data)
+        self._notify_changes(before)
+
+    def _apply_cached_patch(self, patch):
+        """Show the blocks last read for patch until the refresh queued for
+        the patch change confirms or corrects them"""
+        cached = self.patch_cache.get(patch)
+        now = datetime.now()
+        with self.state_lock:
+            self.current_patch = patch
+            if cached is None:
+                return
+            for fx_type, blocks in cached.items():
+                self.current_state[fx_type] = blocks
+                self.current_state["last_sync_ts"][fx_type] = now
+                if fx_type == "fx":
+                    for block in blocks:
+                        self.current_fx_names[block["fx_id"]] = block["name"]
+        logger.info(f"Showing cached state of patch {patch}")
+        for fx_type in cached:
+            self._notify_state_changed(fx_type, now)
+
+    def _queue_block_refreshes(self, received_offset, received_data):
+        """The unit sent several parameters at once, read again the blocks
+        they belong to instead of decoding them"""
+        start = address_to_int(received_offset)
+        blocks = set()
+        for i, value in enumerate(received_data):
+            ret = self.lookup(int_to_address(start + i), value)
+            if ret is None or ret.get("fx_type") is None:
+                continue
+            try:
+                index = int(ret["fx_id"]) - 1 if ret["fx_id"] else 0
+            except ValueError:
+                continue
+            blocks.add((ret["fx_type"], index))
+        for fx_type, index in sorted(blocks):
+            logger.info(f"{fx_type} block {index + 1} changed on the unit")
+            self.queue_refresh({"type": "block", "fx_type": fx_type, "index": index})
@@ -0,0 +1,69 @@
+import flask
+import json
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Send a comment line when nothing changed for a while so proxies and the
+# browser don't consider the stream dead.
+KEEPALIVE_SEC = 15
+
+# Refused streams tell the browser to try again after this long
+RETRY_AFTER_SEC = 10
+
+
+def format_event(seq, fx_types):
+    return f"data: {json.dumps({'seq': seq, 'fx_types': fx_types})}\n\n"
+
+
+def register_routes(server, state_store, presence, max_streams=None):
+    """Each stream keeps a thread of the server busy, past max_streams they
+    are refused so the callbacks still get a thread"""
+    lock = threading.Lock()
+    open_streams = 0
+
+    @server.route("/events")
+    def events():
+        nonlocal open_streams
+        client_id = flask.request.args.get("client") or uuid.uuid4().hex
+        with lock:
+            full = max_streams is not None and open_streams >= max_streams
+        if full:
+            logger.warning(
+                f"{max_streams} event streams hold the server threads, "
+                "refusing a new one, start with more --threads"
+            )
+            return flask.Response(
+                status=503, headers={"Retry-After": str(RETRY_AFTER_SEC)}
+            )
+
+        def stream():
+            nonlocal open_streams
+            # The client is connected as long as its stream is open, a closed
+            # connection is noticed at the latest with the next keepalive.
+            with lock:
+                open_streams += 1
+            presence.connect(client_id)
+            try:
+                seq, fx_types = state_store.wait(-1, 0)
+                yield format_event(seq, fx_types)
+                while True:
+                    new_seq, fx_types = state_store.wait(seq, KEEPALIVE_SEC)
+                    if new_seq == seq:
+                        yield ": keepalive\n\n"
+                        continue
+                    seq = new_seq
+                    yield format_event(seq, fx_types)
+            finally:
+                presence.disconnect(client_id)
+                with lock:
+                    open_streams -= 1
+
+        return flask.Response(
+            stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -0,0 +1,198 @@
+from bisect import bisect_left
+import flask
+import threading
+import time
+
+# Upper bounds of the buckets, in seconds. A reply of the unit takes a few
+# milliseconds, a refresh of all the fx_types up to a few seconds.
+MIDI_BUCKETS = [0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2]
+REFRESH_BUCKETS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+HANDLER_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Prometheus counter, one value per combination of labels"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # label values -> count
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def lines(self):
+        with self.lock:
+            values = dict(self.values)
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(values.items()):
+            labels = format_labels(zip(self.labelnames, key))
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Histogram:
+    """Prometheus histogram, observing a value is a bisect and an addition
+    under a lock so it can stay enabled all the time"""
+
+    def __init__(self, name, help, labelnames=(), buckets=MIDI_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = list(buckets) + [float("inf")]
+        self.lock = threading.Lock()
+        # label values -> [count of each bucket, sum, count]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = entry = self.values[key]
+            counts[index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def lines(self):
+        with self.lock:
+            values = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self.values.items()
+            }
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(labels + [("le", format_value(bound))])
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(labels)} {count}"
+
+
+def collected_lines(name, kind, help, values):
+    """Lines of a metric of another module read when /metrics is requested,
+    values are (labels, value)"""
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    for labels, value in values:
+        yield f"{name}{format_labels(labels)} {format_value(value)}"
+
+
+sysex_round_trip = Histogram(
+    "gt1000pilot_sysex_round_trip_seconds",
+    "Time from sending RQ1 messages to receiving all their DT1 replies",
+    ["read"],
+    MIDI_BUCKETS,
+)
+replies_timed_out = Counter(
+    "gt1000pilot_sysex_replies_timed_out_total",
+    "RQ1 messages not answered in time",
+    ["read"],
+)
+refresh_duration = Histogram(
+    "gt1000pilot_refresh_duration_seconds",
+    "Duration of the refresh cycles reading fx_type, with the other fx_types "
+    "read by the same cycle",
+    ["fx_type"],
+    REFRESH_BUCKETS,
+)
+handler_duration = Histogram(
+    "gt1000pilot_handler_duration_seconds",
+    "Time spent answering the Dash callbacks, by function, and the other "
+    "requests, by endpoint",
+    ["handler"],
+    HANDLER_BUCKETS,
+)
+
+
+def register_routes(app, gt1000, write_queue):
+    """/metrics in the Prometheus text format, and the timing of the
+    requests of app"""
+
+    dash_update = app.config.routes_pathname_prefix + "_dash-update-component"
+
+    def handler_name():
+        if flask.request.endpoint == dash_update:
+            body = flask.request.get_json(silent=True) or {}
+            callback = app.callback_map.get(body.get("output"), {}).get("callback")
+            if callback is not None:
+                return callback.__name__
+        return flask.request.endpoint or "unknown"
+
+    @app.server.before_request
+    def start_timer():
+        flask.g.metrics_start = time.monotonic()
+
+    @app.server.teardown_request
+    def stop_timer(error=None):
+        start = flask.g.pop("metrics_start", None)
+        if start is None or flask.request.endpoint == "metrics":
+            return
+        handler_duration.observe(time.monotonic() - start, handler=handler_name())
+
+    @app.server.route("/metrics")
+    def metrics():
+        stats = gt1000.scheduler.stats()
+        lines = []
+        for metric in [
+            sysex_round_trip,
+            replies_timed_out,
+            refresh_duration,
+            handler_duration,
+        ]:
+            lines += metric.lines()
+        lines += collected_lines(
+            "gt1000pilot_midi_queue_depth",
+            "gauge",
+            "MIDI jobs waiting for the scheduler thread",
+            [
+                ([("priority", name)], counters["depth"])
+                for name, counters in stats.items()
+            ],
+        )
+        lines += collected_lines(
+            "gt1000pilot_midi_jobs_failed_total",
+            "counter",
+            "MIDI jobs that raised an exception",
+            [
+                ([("priority", name)], counters["failed"])
+                for name, counters in stats.items()
+            ],
+        )
+        lines += collected_lines(
+            "gt1000pilot_write_queue_depth",
+            "gauge",
+            "Slider values waiting to be sent",
+            [([], write_queue.depth())],
+        )
+        lines += collected_lines(
+            "gt1000pilot_slider_values_coalesced_total",
+            "counter",
+            "Slider values replaced by a newer one before being sent",
+            [([], write_queue.coalesced)],
+        )
+        return flask.Response("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
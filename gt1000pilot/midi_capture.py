@@ -0,0 +1,232 @@
+from collections import deque
+import logging
+import os
+import struct
+import threading
+import time
+
+from gt1000pilot.simulator import SimulatedMidiIn, SimulatedMidiOut
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Start of the file, then the format version
+MAGIC = b"GT1KMIDI"
+FORMAT_VERSION = 1
+HEADER = MAGIC + struct.pack("B", FORMAT_VERSION)
+
+# Each message is the microseconds since the previous one, its direction and
+# its length, followed by its bytes. A gap longer than the 32 bits of the
+# delay, more than an hour, is shortened.
+RECORD = struct.Struct("<IBH")
+MAX_DELAY_US = 0xFFFFFFFF
+
+# Direction of the messages
+IN = 0
+OUT = 1
+
+# Messages kept in memory until the writer thread saves them, the oldest
+# ones are dropped if it falls behind
+DEFAULT_MAX_MESSAGES = 65536
+# The writer thread saves the messages at least this often
+FLUSH_INTERVAL_SEC = 1
+
+# How long the replay waits for the app to send what it sent before a
+# message of the capture, it is delivered anyway after that
+GATE_TIMEOUT_SEC = 2
+
+
+class MidiRecorder:
+    """Logs the MIDI messages sent and received by gt1000 to a file.
+
+    The MIDI threads only append the messages to a bounded ring buffer, a
+    writer thread saves them every second. Read the file back with
+    read_capture() and replay it with ReplayedGT1000.
+    """
+
+    def __init__(self, gt1000, max_messages=DEFAULT_MAX_MESSAGES):
+        self.gt1000 = gt1000
+        self.cond = threading.Condition()
+        # Serializes the writes to the file, record() never waits for it
+        self.file_lock = threading.Lock()
+        # (time.monotonic_ns(), direction, bytes), oldest first
+        self.buffer = deque(maxlen=max_messages)
+        # Messages dropped because the buffer was full
+        self.dropped = 0
+        self.path = None
+        self.file = None
+        self.last_ns = None
+
+    def start(self, path, max_messages=None):
+        """Record the messages to path from now on, replacing its content"""
+        if max_messages is not None:
+            self.buffer = deque(maxlen=max_messages)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "wb")
+        self.file.write(HEADER)
+        self.path = path
+        threading.Thread(target=self.writer_thread, daemon=True).start()
+        self.gt1000.recorder = self
+        logger.info(f"Recording the MIDI messages to {path}")
+
+    def record(self, direction, message):
+        """Called from the MIDI threads, never waits for the file"""
+        with self.cond:
+            # Taken under the lock, the times of the buffer never go back
+            now = time.monotonic_ns()
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append((now, direction, bytes(message)))
+
+    def flush(self):
+        """Save the messages recorded so far, before exiting"""
+        if self.file is None:
+            return
+        # Held from taking the messages to saving them, the messages of two
+        # flushes can't interleave
+        with self.file_lock:
+            with self.cond:
+                records = self.buffer
+                self.buffer = deque(maxlen=records.maxlen)
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning(f"MIDI capture full, dropped {dropped} messages")
+            data = bytearray()
+            for ns, direction, message in records:
+                delay = 0 if self.last_ns is None else (ns - self.last_ns) // 1000
+                data += RECORD.pack(min(delay, MAX_DELAY_US), direction, len(message))
+                data += message
+                self.last_ns = ns
+            self.file.write(data)
+            self.file.flush()
+
+    def writer_thread(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL_SEC)
+            try:
+                self.flush()
+            except Exception:
+                # Catch all to keep the thread alive
+                logger.exception(f"Failed to save the MIDI messages to {self.path}")
+
+
+def read_capture(path):
+    """Return the (seconds since the first message, direction, message) of a
+    file written by MidiRecorder, raise ValueError if it is not one"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(HEADER):
+        raise ValueError(f"{path} is not a MIDI capture of this version")
+    records = []
+    pos = len(HEADER)
+    ts_us = 0
+    while pos + RECORD.size <= len(data):
+        delay, direction, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + length > len(data):
+            break
+        ts_us += delay
+        records.append((ts_us / 1e6, direction, list(data[pos : pos + length])))
+        pos += length
+    if pos != len(data):
+        # The recorder died while writing
+        logger.warning(f"Ignoring the truncated end of {path}")
+    return records
+
+
+class ReplayedGT1000:
+    """Stands in for the MIDI ports of the unit, the app receives the
+    messages received in a capture.
+
+    The replay starts with the first message sent by the app, the identity
+    request of open_ports(). Each message is delivered once the app sent as
+    many messages as before it in the capture, then after the same delay as
+    in the capture divided by speed, so a reply never comes before its
+    request whatever the speed. A speed of 0 delivers them as fast as the
+    app sends its requests.
+    """
+
+    def __init__(self, records, speed=1, gate_timeout=GATE_TIMEOUT_SEC):
+        self.speed = speed
+        self.gate_timeout = gate_timeout
+        # (ts, message, messages sent before it, ts of the last one)
+        self.replies = []
+        sent_ts = []
+        for ts, direction, message in records:
+            if direction == OUT:
+                sent_ts.append(ts)
+                continue
+            self.replies.append(
+                (ts, message, len(sent_ts), sent_ts[-1] if sent_ts else None)
+            )
+
+        self.midi_out = SimulatedMidiOut(self)
+        self.midi_in = SimulatedMidiIn(self)
+
+        self.cond = threading.Condition()
+        # time.monotonic() of each message sent by the app
+        self.sent_times = []
+        self.delivered = 0
+        # Messages delivered before the app sent what it sent in the capture
+        self.diverged = 0
+        self.finished = threading.Event()
+        self.stop = False
+        self.thread = threading.Thread(target=self.replay_thread, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def load(cls, path, speed=1):
+        return cls(read_capture(path), speed)
+
+    def close(self):
+        with self.cond:
+            self.stop = True
+            self.cond.notify_all()
+
+    def receive(self, message):
+        """A message sent by the app"""
+        with self.cond:
+            self.sent_times.append(time.monotonic())
+            self.cond.notify_all()
+
+    def delay(self, seconds):
+        return seconds / self.speed if self.speed else 0
+
+    def replay_thread(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.sent_times or self.stop)
+        # (ts in the capture, time.monotonic()) of the last message delivered
+        last = None
+        for ts, message, sent, sent_ts in self.replies:
+            with self.cond:
+                if not self.cond.wait_for(
+                    lambda: len(self.sent_times) >= sent or self.stop,
+                    self.gate_timeout,
+                ):
+                    self.diverged += 1
+                if self.stop:
+                    return
+                due = time.monotonic()
+                if sent and len(self.sent_times) >= sent:
+                    due = max(due, self.sent_times[sent - 1] + self.delay(ts - sent_ts))
+                if last is not None:
+                    due = max(due, last[1] + self.delay(ts - last[0]))
+                while not self.stop and time.monotonic() < due:
+                    self.cond.wait(due - time.monotonic())
+                if self.stop:
+                    return
+            now = time.monotonic()
+            callback = self.midi_in.callback
+            if callback is not None:
+                try:
+                    delta = 0 if last is None else now - last[1]
+                    callback((message, delta), self.midi_in.data)
+                except Exception:
+                    logger.exception("Replay MIDI input callback failed")
+            self.delivered += 1
+            last = (ts, now)
+        logger.info(
+            f"Replay finished, {self.delivered} messages delivered, "
+            f"{self.diverged} without their request"
+        )
+        self.finished.set()
@@ -0,0 +1,94 @@
+from concurrent.futures import Future
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Priority classes, lower runs first
+USER = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {USER: "user", BACKGROUND: "background"}
+
+
+class MidiScheduler:
+    """Runs every exchange with the unit on a single thread.
+
+    Jobs are run by priority class, then in the order they were submitted.
+    A background refresh is split in one job per read, so a user action
+    submitted during a sweep only waits for the read in flight.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        # (priority, seq, submit time, func, args, future)
+        self.jobs = []
+        self.seq = 0
+        self.counters = {
+            priority: {
+                "depth": 0,
+                "submitted": 0,
+                "completed": 0,
+                "failed": 0,
+                "wait_total_sec": 0.0,
+                "wait_max_sec": 0.0,
+            }
+            for priority in PRIORITY_NAMES
+        }
+        self.thread = threading.Thread(target=self.scheduler_thread, daemon=True)
+        self.thread.start()
+
+    def submit(self, priority, func, *args):
+        """Queue func(*args), return a Future of its result"""
+        future = Future()
+        with self.cond:
+            self.seq += 1
+            heapq.heappush(
+                self.jobs, (priority, self.seq, time.monotonic(), func, args, future)
+            )
+            self.counters[priority]["depth"] += 1
+            self.counters[priority]["submitted"] += 1
+            self.cond.notify_all()
+        return future
+
+    def call(self, priority, func, *args):
+        """Run func(*args) on the scheduler thread and return its result"""
+        if threading.current_thread() is self.thread:
+            # Already in a job, queueing would deadlock
+            return func(*args)
+        return self.submit(priority, func, *args).result()
+
+    def stats(self):
+        """Queue depth and wait time counters of each priority class"""
+        with self.cond:
+            return {
+                PRIORITY_NAMES[priority]: dict(counters)
+                for priority, counters in self.counters.items()
+            }
+
+    def scheduler_thread(self):
+        while True:
+            with self.cond:
+                while not self.jobs:
+                    self.cond.wait()
+                priority, _, submitted, func, args, future = heapq.heappop(self.jobs)
+                counters = self.counters[priority]
+                counters["depth"] -= 1
+                wait = time.monotonic() - submitted
+                counters["wait_total_sec"] += wait
+                counters["wait_max_sec"] = max(counters["wait_max_sec"], wait)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+                failed = False
+            except Exception as e:
+                # Catch all to keep the thread alive
+                logger.exception(f"MIDI job {func.__name__} failed")
+                future.set_exception(e)
+                failed = True
+            with self.cond:
+                counters["completed"] += 1
+                counters["failed"] += failed
@@ -1,27 +1,32 @@
 import dash
-from dash import Input, Output, callback
+from dash import Input, State, callback
+from dash.exceptions import PreventUpdate
 
 from gt1000pilot.pages.pages_common import (
     refresh_all_effects,
-    generate_buttons,
+    update_grid,
+    grid_outputs,
     serve_layout,
-    callbacks_registered,
+    needs_refresh,
+    refresh_paused_id,
 )
 
 dash.register_page(__name__, path="/dist")
 
 state_key = "dist"
 
-callbacks_registered[state_key] = False
-
 
 @callback(
-    Output(f"{state_key}_buttons", "children"),
-    Input(f"interval-component_{state_key}", "n_intervals"),
+    *grid_outputs(state_key),
+    Input("state-events", "data"),
+    Input(refresh_paused_id(state_key), "data"),
+    State(f"{state_key}_rendered", "data"),
 )
-def update_metrics(n):
-    refresh_all_effects(state_key)
-    return generate_buttons(state_key)
+def update_metrics(event, paused, rendered):
+    if not needs_refresh(state_key, event, paused):
+        raise PreventUpdate
+    seq = refresh_all_effects(state_key)
+    return update_grid(state_key, seq, rendered)
 
 
 layout = serve_layout(state_key)
@@ -1,12 +1,33 @@
-from dash import html, dcc, Input, Output, get_app, State, callback_context, ALL
+from dash import (
+    html,
+    dcc,
+    Input,
+    Output,
+    State,
+    ClientsideFunction,
+    callback,
+    callback_context,
+    clientside_callback,
+    no_update,
+    ALL,
+    MATCH,
+)
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-from datetime import datetime
 
-from gt1000pilot.shared import gt1000, off_color, on_color, logger, buttons_pc_height
+from gt1000pilot.render_cache import RenderCache, to_plain
+from gt1000pilot.shared import (
+    gt1000,
+    catalog,
+    logger,
+    buttons_pc_height,
+    state_store,
+    write_queue,
+    dash_effects,
+)
 
-last_action_ts = None
-
-callbacks_registered = {}
+# Grid of each fx_type, rendered once for all the clients
+render_cache = RenderCache()
 
 
 def get_icon(fx_type):
@@ -22,92 +43,65 @@ def get_icon(fx_type):
     return f"{prefix}stompbox-fx.png"
 
 
-def register_callbacks(app, fx_type):
-    for n in range(1, len(gt1000.dash_effects[fx_type]) + 1):
-        app.callback(
-            Output(f"{fx_type}_toggle_fx{n}", "style"),
-            Input(f"{fx_type}_toggle_fx{n}", "n_clicks"),
-            prevent_initial_call=True,
-        )(lambda n_clicks, fx_num=n: send_fx_state_command(fx_type, fx_num, n_clicks))
+def toggle_id(fx_type, fx_id):
+    return {"type": "fx-toggle", "fx_type": fx_type, "fx_id": fx_id}
 
-        app.callback(
-            [
-                Output(f"modal_more_{fx_type}_{n}", "is_open"),
-                Output(
-                    f"interval-component_{fx_type}", "disabled", allow_duplicate=True
-                ),
-                Output(f"modal-body_{fx_type}_{n}", "children"),
-            ],
-            [
-                Input(f"button_more_{fx_type}_{n}", "n_clicks"),
-                Input(f"close_{fx_type}_{n}", "n_clicks"),
-                Input(
-                    {
-                        "type": "effect-button",
-                        "fx_type": fx_type,
-                        "fx_id": n,
-                        "label": ALL,
-                    },
-                    "n_clicks",
-                ),
-            ],
-            [State(f"modal_more_{fx_type}_{n}", "is_open")],
-            prevent_initial_call=True,
-        )(
-            lambda button_clicks,
-            close_clicks,
-            all_buttons,
-            is_open,
-            fx_num=n: handle_more_button(
-                fx_type, fx_num, button_clicks, close_clicks, all_buttons, is_open
-            )
-        )
 
-        # Slider callback
-        for s in ["slider1", "slider2"]:
-            slider_dict = gt1000.dash_effects[fx_type][n - 1][s]
-            if slider_dict is not None:
-                slider_id = f"{s}_{fx_type}{n}"
-
-                app.callback(
-                    Input(slider_id, "value"),
-                    prevent_initial_call=True,
-                )(
-                    lambda value,
-                    fx_type=fx_type,
-                    fx_id=n,
-                    slider=s: handle_slider_change(value, fx_type, fx_id, slider)
-                )
+def name_id(fx_type, fx_id):
+    return {"type": "fx-name", "fx_type": fx_type, "fx_id": fx_id}
 
 
-def refresh_all_effects(fx_type):
-    global callbacks_registered
-    gt1000_ready = True
-    try:
-        if fx_type not in gt1000.get_state():
-            current_state = {fx_type: []}
-            gt1000_ready = False
-        current_state = gt1000.get_state()
-    except Exception:
-        # Catch all to avoid dying on unhandled exceptions
-        logger.exception("Exception caught for toggle_fx_state")
-    # If we clicked on a button but the current_state from the pedal wasn't
-    # sync'ed yet, we want to keep our old state otherwise the pedal color will
-    # go back to its previous state.
-    if (
-        last_action_ts is None
-        or current_state["last_sync_ts"][fx_type] > last_action_ts
-    ):
-        gt1000.dash_effects[fx_type] = current_state[fx_type]
-    for i in range(len(gt1000.dash_effects[fx_type])):
-        if gt1000.dash_effects[fx_type][i]["state"] == "OFF":
-            gt1000.dash_effects[fx_type][i]["color"] = off_color
-        else:
-            gt1000.dash_effects[fx_type][i]["color"] = on_color
+def slider_id(fx_type, fx_id, slider):
+    return {"type": "fx-slider", "fx_type": fx_type, "fx_id": fx_id, "slider": slider}
+
+
+def more_id(fx_type, fx_id):
+    return {"type": "fx-more", "fx_type": fx_type, "fx_id": fx_id}
+
+
+def close_id(fx_type, fx_id):
+    return {"type": "fx-close", "fx_type": fx_type, "fx_id": fx_id}
+
 
-    if gt1000_ready and not callbacks_registered[fx_type]:
-        register_callbacks(get_app(), fx_type)
-        callbacks_registered[fx_type] = True
+def modal_id(fx_type, fx_id):
+    return {"type": "fx-modal", "fx_type": fx_type, "fx_id": fx_id}
+
+
+def modal_body_id(fx_type, fx_id):
+    return {"type": "fx-modal-body", "fx_type": fx_type, "fx_id": fx_id}
+
+
+def effect_button_id(fx_type, fx_id, label):
+    return {"type": "effect-button", "fx_type": fx_type, "fx_id": fx_id, "label": label}
+
+
+def type_choice_id(fx_type, fx_id):
+    return {"type": "fx-type-choice", "fx_type": fx_type, "fx_id": fx_id}
+
+
+def refresh_paused_id(fx_type):
+    return {"type": "refresh-paused", "fx_type": fx_type}
+
+
+def toggle_class(state):
+    """Classes of assets/style.css for a toggle in state, assets/blocks.js
+    switches them too"""
+    if state == "OFF":
+        return "fx-toggle fx-off"
+    return "fx-toggle fx-on"
+
+
+def refresh_all_effects(fx_type):
+    """Copy the state of fx_type from the store to dash_effects if it changed,
+    return the seq of the store dash_effects is up to date with"""
+    seq, version = state_store.versions(fx_type)
+    snapshot = dash_effects.get()
+    if snapshot.version(fx_type) < version or fx_type not in snapshot:
+        # The changes made from the dashboard are already in the store, it
+        # doesn't revert them with values read before they reached the unit.
+        seq, blocks = state_store.read(fx_type)
+        dash_effects.update(lambda snapshot: snapshot.replace(fx_type, blocks, seq))
+    return seq
 
 
 def build_one_slider(fx_type, fx_id, slider, slider_name):
@@ -120,66 +114,34 @@ def build_one_slider(fx_type, fx_id, slider, slider_name):
         marks = {}
     return html.Div(
         [
-            html.Label(
-                slider["label"], style={"text-align": "center", "width": "100%"}
-            ),
+            html.Label(slider["label"], className="fx-slider-label"),
             dcc.Slider(
                 min=slider["min"],
                 max=slider["max"],
                 value=slider["value"],
-                id=f"{slider_name}_{fx_type}{fx_id}",
+                id=slider_id(fx_type, fx_id, slider_name),
                 marks=marks,
             ),
         ]
     )
 
 
-# Function to generate the button grid
-def generate_modal_button_grid(fx_type, fx_id, button_labels, selected_button):
-    num_buttons = len(button_labels)
-    buttons = []
-    for i in range(num_buttons):
-        label = button_labels[i]
-        buttons.append(
-            dbc.Button(
-                children=label,
-                id={
-                    "type": "effect-button",
-                    "fx_type": fx_type,
-                    "fx_id": fx_id,
-                    "label": label,
-                },
-                color="primary" if label != selected_button else "secondary",
-                style={"margin": "5px", "width": "100%", "height": "100%"},
-                n_clicks=0,
-            )
-        )
-
-    # Create a responsive grid layout for the buttons
-    grid_layout = dbc.Row(
-        [dbc.Col(button, width=3) for button in buttons],
-        className="g-2",
-        style={"display": "flex", "flex-wrap": "wrap"},
-    )
-
-    return grid_layout
-
-
 def get_modal(fx_type, fx_id):
     return dbc.Modal(
         [
             dbc.ModalHeader(dbc.ModalTitle(f"{fx_type}{fx_id}")),
-            dbc.ModalBody(id=f"modal-body_{fx_type}_{fx_id}"),
+            # Filled by assets/type_picker.js from the catalog of fx_type
+            dbc.ModalBody(id=modal_body_id(fx_type, fx_id)),
             dbc.ModalFooter(
                 dbc.Button(
                     "Close",
-                    id=f"close_{fx_type}_{fx_id}",
+                    id=close_id(fx_type, fx_id),
                     className="ms-auto",
                     n_clicks=0,
                 )
             ),
         ],
-        id=f"modal_more_{fx_type}_{fx_id}",
+        id=modal_id(fx_type, fx_id),
         is_open=False,
         backdrop="static",
         size="xl",  # Extra large modal to cover the full screen
@@ -188,29 +150,39 @@ def get_modal(fx_type, fx_id):
     )
 
 
-def build_grid(fx_type):
+def get_type_choice(fx_type, fx_id):
+    """The type picked in the modal, the only thing it sends to the server"""
+    return dcc.Store(id=type_choice_id(fx_type, fx_id))
+
+
+def build_grid(fx_type, blocks=None):
+    if blocks is None:
+        blocks = dash_effects.get().blocks(fx_type)
     grid = []
-    num_effects = len(gt1000.dash_effects[fx_type])
+    num_effects = len(blocks)
+    if num_effects == 0:
+        # Not read from the unit yet, rebuilt once it is
+        return [
+            dbc.Col(html.Div("Syncing with the GT-1000...", className="fx-syncing"))
+        ]
     col_width = int(12 / num_effects)  # Column width based on number of effects
 
     for n in range(1, num_effects + 1):
-        slider1_dict = gt1000.dash_effects[fx_type][n - 1]["slider1"]
-        slider2_dict = gt1000.dash_effects[fx_type][n - 1]["slider2"]
+        slider1_dict = blocks[n - 1]["slider1"]
+        slider2_dict = blocks[n - 1]["slider2"]
 
         sliders = html.Div(
             [
                 html.Div(
-                    children=html.Button(children="+", id=f"button_more_{fx_type}_{n}"),
-                    style={"text-align": "center"},
+                    children=html.Button(children="+", id=more_id(fx_type, n)),
+                    className="fx-more",
                 ),
                 get_modal(fx_type, n),
+                get_type_choice(fx_type, n),
                 build_one_slider(fx_type, n, slider1_dict, "slider1"),
                 build_one_slider(fx_type, n, slider2_dict, "slider2"),
             ],
-            style={
-                "width": "100%",
-                "padding": "10px 0",
-            },  # Ensure full width and some spacing
+            className="fx-sliders",
         )
 
         grid.append(
@@ -220,232 +192,256 @@ def build_grid(fx_type):
                     html.Div(
                         [
                             html.Button(
-                                id=f"{fx_type}_toggle_fx{n}",
+                                id=toggle_id(fx_type, n),
                                 children=[
                                     html.Div(
                                         children=[
                                             html.Img(
                                                 src=get_icon(fx_type),
-                                                style={
-                                                    "max-width": "80%",  # Ensure the image width is capped at 100% of its container
-                                                    "max-height": "80%",  # Ensure the image height is capped at 100% of its container
-                                                    "width": "auto",  # Adjust the width to maintain aspect ratio
-                                                    "height": "auto",  # Adjust the height to maintain aspect ratio
-                                                    "object-fit": "contain",  # Ensure the entire image is visible, scaling as needed
-                                                },
+                                                className="fx-icon",
                                             ),
                                             html.H2(
-                                                id=f"fx{n}_name",
-                                                children=gt1000.dash_effects[fx_type][
-                                                    n - 1
-                                                ]["name"],
-                                                style={
-                                                    "text-align": "center",
-                                                    "margin": "0",
-                                                },  # Center text and remove margins
+                                                id=name_id(fx_type, n),
+                                                children=blocks[n - 1]["name"],
+                                                className="fx-name",
                                             ),
                                         ],
-                                        style={
-                                            "color": "black",
-                                            "text-align": "center",
-                                            "height": "100%",
-                                            "display": "flex",
-                                            "flex-direction": "column",
-                                            "justify-content": "center",
-                                            "align-items": "center",
-                                            "width": "100%",  # Ensure full width for the content within the button
-                                        },
+                                        className="fx-toggle-content",
                                     )
                                 ],
                                 n_clicks=0,
-                                style={
-                                    "backgroundColor": gt1000.dash_effects[fx_type][
-                                        n - 1
-                                    ]["color"],
-                                    "display": "flex",
-                                    "flex-direction": "column",
-                                    "align-items": "center",
-                                    "justify-content": "center",
-                                    "width": "100%",  # Ensure button takes full width of column
-                                    "height": "100%",  # Ensure button takes full height of column
-                                    "box-sizing": "border-box",  # Include padding/border in size calculations
-                                    "overflow": "hidden",  # Prevent any content overflow
-                                    "textDecoration": "none",
-                                },
+                                className=toggle_class(blocks[n - 1]["state"]),
                             ),
                             sliders,
                         ],
-                        style={
-                            "display": "flex",
-                            "flex-direction": "column",  # Stack button and slider vertically
-                            "align-items": "center",
-                            "width": "100%",  # Ensure full width of the container
-                        },
+                        className="fx-block",
                     ),
                 ],
-                style={
-                    "padding": "0",  # Remove padding to prevent overflow
-                    "display": "flex",  # Flexbox to handle alignment within the column
-                    "align-items": "stretch",  # Stretch button to fill column height
-                },
+                className="fx-col",
             )
         )
 
     return grid
 
 
-def generate_buttons(fx_type):
-    grid = build_grid(fx_type)
+def generate_buttons(fx_type, blocks=None):
+    grid = build_grid(fx_type, blocks)
     return html.Div(
         children=[
             dbc.Row(
                 id="button_grid_content",
                 children=grid,
-                style={
-                    "display": "flex",
-                    "flex-wrap": "nowrap",  # Ensure items do not wrap to a new row
-                    "justify-content": "space-evenly",  # Evenly space out the columns
-                    "grid-template-columns": "repeat(auto-fill, minmax(100px, 1fr))",
-                    "align-items": "stretch",  # Make sure all columns stretch to the same height
-                    "overflow": "hidden",  # Prevent scrollbars
-                    "width": "100%",
-                    "height": "100%",  # Ensure the grid takes full height of its container
-                },
+                className="fx-grid",
             ),
         ],
-        style={
-            "display": "flex",
-            "flex-direction": "column",
-            "height": f"{buttons_pc_height}vh",  # This should match the max-height defined earlier
-            "overflow": "hidden",  # Prevent scrollbars on the outer container
-        },
+        className="fx-buttons",
+        # This should match the max-height defined earlier
+        style={"height": f"{buttons_pc_height}vh"},
     )
 
 
+def render_grid(fx_type, blocks):
+    """generate_buttons() of blocks, shared by all the clients"""
+    return render_cache.get(
+        fx_type, blocks, lambda: to_plain(generate_buttons(fx_type, blocks))
+    )
+
+
+def slider_range(slider):
+    if slider is None:
+        return None
+    return [slider["label"], slider["min"], slider["max"]]
+
+
+def grid_layout(blocks):
+    # Changing the type of a block can add/remove sliders or change their
+    # range, this requires rebuilding the grid.
+    return [[slider_range(fx["slider1"]), slider_range(fx["slider2"])] for fx in blocks]
+
+
+def grid_outputs(fx_type):
+    return [
+        Output(f"{fx_type}_buttons", "children"),
+        Output(toggle_id(fx_type, ALL), "className"),
+        Output(name_id(fx_type, ALL), "children"),
+        Output(slider_id(fx_type, ALL, ALL), "value"),
+        Output(f"{fx_type}_rendered", "data"),
+    ]
+
+
+def update_grid(fx_type, seq, rendered):
+    """Outputs for grid_outputs() to bring a client from the state it
+    rendered to the state of dash_effects at seq"""
+    changed = None
+    if rendered is not None and rendered["seq"] <= seq:
+        changed = state_store.changes_since(rendered["seq"], fx_type, until=seq)
+    if changed is not None and len(changed) == 0:
+        raise PreventUpdate
+
+    effects = dash_effects.get().blocks(fx_type)
+    layout = grid_layout(effects)
+    toggles, names, sliders = callback_context.outputs_list[1:4]
+    if changed is None or layout != rendered["layout"]:
+        return (
+            render_grid(fx_type, effects),
+            [no_update] * len(toggles),
+            [no_update] * len(names),
+            [no_update] * len(sliders),
+            {"seq": seq, "layout": layout},
+        )
+
+    classes = []
+    for output in toggles:
+        n = output["id"]["fx_id"]
+        if (fx_type, n - 1, "state") in changed:
+            classes.append(toggle_class(effects[n - 1]["state"]))
+        else:
+            classes.append(no_update)
+    fx_names = []
+    for output in names:
+        n = output["id"]["fx_id"]
+        if (fx_type, n - 1, "name") in changed:
+            fx_names.append(effects[n - 1]["name"])
+        else:
+            fx_names.append(no_update)
+    values = []
+    for output in sliders:
+        n = output["id"]["fx_id"]
+        s = output["id"]["slider"]
+        if (fx_type, n - 1, s) in changed:
+            values.append(effects[n - 1][s]["value"])
+        else:
+            values.append(no_update)
+    return no_update, classes, fx_names, values, {"seq": seq, "layout": layout}
+
+
+def needs_refresh(fx_type, event, paused):
+    # Always check when the page gets mounted, then only when a change for
+    # this fx_type is pushed or the type selection modal gets closed.
+    trigger_id = callback_context.triggered_id
+    if trigger_id is None:
+        return True
+    if paused:
+        return False
+    if trigger_id == refresh_paused_id(fx_type):
+        return True
+    return event is not None and fx_type in event["fx_types"]
+
+
 def serve_layout(fx_type):
-    refresh_all_effects(fx_type)
+    seq = refresh_all_effects(fx_type)
+    blocks = dash_effects.get().blocks(fx_type)
     return html.Div(
         id="button-grid",
         children=[
-            dcc.Interval(
-                id=f"interval-component_{fx_type}",
-                interval=2 * 1000,  # in milliseconds
-                n_intervals=0,
-                disabled=False,
+            # Set while the type selection modal is open, rebuilding the grid
+            # would close it.
+            dcc.Store(id=refresh_paused_id(fx_type), data=False),
+            dcc.Store(
+                id=f"{fx_type}_rendered",
+                data={"seq": seq, "layout": grid_layout(blocks)},
+            ),
+            html.Div(
+                id=f"{fx_type}_buttons", children=generate_buttons(fx_type, blocks)
             ),
-            html.Div(id=f"{fx_type}_buttons", children=generate_buttons(fx_type)),
         ],
     )
 
 
-def send_fx_state_command(fx_type, fx_num, n_clicks):
-    if not n_clicks:
-        return
-    global last_action_ts
-    last_action_ts = datetime.now()
-    if gt1000.dash_effects[fx_type][fx_num - 1]["state"] == "ON":
-        logger.info(f"{fx_type}{fx_num} enabled")
-        try:
-            gt1000.toggle_fx_state(fx_type, str(fx_num), "OFF")
-        except Exception:
-            # Catch all to avoid dying on unhandled exceptions
-            logger.exception("Exception caught for toggle_fx_state")
-        # optimistically update here
-        gt1000.dash_effects[fx_type][fx_num - 1]["state"] = "OFF"
-        return {
-            "backgroundColor": off_color,
-            "display": "flex",
-            "flex-direction": "column",
-            "align-items": "center",
-            "justify-content": "center",
-            "width": "100%",  # Ensure button takes full width of column
-            "height": "100%",  # Ensure button takes full height of column
-            "box-sizing": "border-box",  # Include padding/border in size calculations
-            "overflow": "hidden",  # Prevent any content overflow
-            "textDecoration": "none",
-        }
-    else:
-        try:
-            gt1000.toggle_fx_state(fx_type, str(fx_num), "ON")
-        except Exception:
-            # Catch all to avoid dying on unhandled exceptions
-            logger.exception("Exception caught for toggle_fx_state")
-        logger.info(f"{fx_type}{fx_num} disabled")
-        # optimistically update here
-        gt1000.dash_effects[fx_type][fx_num - 1]["state"] = "ON"
-        return {
-            "backgroundColor": on_color,
-            "display": "flex",
-            "flex-direction": "column",
-            "align-items": "center",
-            "justify-content": "center",
-            "width": "100%",  # Ensure button takes full width of column
-            "height": "100%",  # Ensure button takes full height of column
-            "box-sizing": "border-box",  # Include padding/border in size calculations
-            "overflow": "hidden",  # Prevent any content overflow
-            "textDecoration": "none",
-        }
-
-
-def handle_more_button(
-    fx_type, fx_num, button_clicks, close_clicks, all_buttons, is_open
-):
-    ctx = callback_context
-    trigger_id = ctx.triggered[0]["prop_id"].split(".")[0]
-
-    # Determine which action was triggered
-    if f"button_more_{fx_type}_{fx_num}" in trigger_id and button_clicks:
-        # Open the modal
-        all_types = gt1000.get_all_fx_types(fx_type)
-        return (
-            True,
-            True,
-            generate_modal_button_grid(
-                fx_type,
-                fx_num,
-                all_types,
-                selected_button=gt1000.dash_effects[fx_type][fx_num - 1]["name"],
-            ),
+def select_fx_type(fx_type, fx_num, selected_effect):
+    if selected_effect not in catalog.fx_types(fx_type):
+        logger.error(f"Unknown type {selected_effect} for {fx_type}{fx_num}")
+        raise PreventUpdate
+    logger.info(f"Switching {fx_type}{fx_num} to {selected_effect}")
+    if not gt1000.set_fx_type_type(fx_type, fx_num, selected_effect):
+        # Nothing was sent, the name shown stays the one of the unit
+        raise PreventUpdate
+    dash_effects.update(
+        lambda snapshot: snapshot.update_block(
+            fx_type, fx_num - 1, name=selected_effect
         )
-    elif f"close_{fx_type}_{fx_num}" in trigger_id and close_clicks:
-        # Close the modal
-        return False, False, html.Div()
-
-    elif "effect-button" in trigger_id:
-        # Handle button selection within the modal
-        all_types = gt1000.get_all_fx_types(fx_type)
-        selected_button_id = None
-
-        for i, click in enumerate(all_buttons):
-            if click:
-                selected_button_id = i
-                break
-
-        if selected_button_id is not None:
-            selected_effect = all_types[selected_button_id]
-            logger.info(f"Switching {fx_type}{fx_num} to {selected_effect}")
-            gt1000.set_fx_type_type(fx_type, fx_num, selected_effect)
-            gt1000.dash_effects[fx_type][fx_num - 1]["name"] = selected_effect
-            return (
-                False,
-                False,
-                generate_modal_button_grid(
-                    fx_type, fx_num, all_types, selected_button=selected_effect
-                ),
-            )
-
-    # Default return to keep the current state
-    return is_open, False, html.Div()
+    )
+    state_store.set_param(fx_type, fx_num - 1, "name", selected_effect)
+    return selected_effect
 
 
 def handle_slider_change(value, fx_type, fx_id, slider):
-    global last_action_ts
-    last_action_ts = datetime.now()
-    label = gt1000.dash_effects[fx_type][fx_id - 1][slider]["label"]
+    # Refreshes also set the value of the sliders, nothing to send then
+    slider_dict = dash_effects.get().blocks(fx_type)[fx_id - 1][slider]
+    if slider_dict["value"] == value:
+        return
+    label = slider_dict["label"]
     logger.info(f"Slider changed: {fx_type}, {fx_id}, {label}, new value: {value}")
-    gt1000.dash_effects[fx_type][fx_id - 1][slider]["value"] = value
-    try:
-        gt1000.set_fx_value(fx_type, fx_id, label, value)
-    except Exception:
-        # Catch all to avoid dying on unhandled exceptions
-        logger.exception("Exception caught for toggle_fx_state")
+    slider_dict = {**slider_dict, "value": value}
+    dash_effects.update(
+        lambda snapshot: snapshot.update_block(
+            fx_type, fx_id - 1, **{slider: slider_dict}
+        )
+    )
+    state_store.set_param(fx_type, fx_id - 1, slider, slider_dict)
+    # Sent by the write queue thread, a drag only sends its latest value
+    write_queue.put((fx_type, fx_id, slider), (label, value))
+
+
+# The callbacks of the blocks of all the pages, the id of the component that
+# triggered them gives the block.
+
+
+# The toggle changes color in the browser, which posts the new state to the
+# API without waiting for the MIDI write.
+clientside_callback(
+    ClientsideFunction(namespace="blocks", function_name="toggle"),
+    Output(toggle_id(MATCH, MATCH), "className", allow_duplicate=True),
+    Input(toggle_id(MATCH, MATCH), "n_clicks"),
+    State(toggle_id(MATCH, MATCH), "className"),
+    prevent_initial_call=True,
+)
+
+
+# Opening, closing and picking a type in the modal are handled by the
+# browser.
+clientside_callback(
+    ClientsideFunction(namespace="type_picker", function_name="update"),
+    Output(modal_id(MATCH, MATCH), "is_open"),
+    Output(modal_body_id(MATCH, MATCH), "children"),
+    Output(type_choice_id(MATCH, MATCH), "data"),
+    Input(more_id(MATCH, MATCH), "n_clicks"),
+    Input(close_id(MATCH, MATCH), "n_clicks"),
+    Input(effect_button_id(MATCH, MATCH, ALL), "n_clicks"),
+    State(name_id(MATCH, MATCH), "children"),
+    prevent_initial_call=True,
+)
+
+
+@callback(
+    Output(name_id(MATCH, MATCH), "children", allow_duplicate=True),
+    Input(type_choice_id(MATCH, MATCH), "data"),
+    prevent_initial_call=True,
+)
+def type_chosen(selected_effect):
+    block = callback_context.triggered_id
+    return select_fx_type(block["fx_type"], block["fx_id"], selected_effect)
+
+
+# Refreshes of a page are paused while one of its type selection modals is
+# open, rebuilding the grid would close it.
+clientside_callback(
+    "function (allOpen) { return allOpen.some(Boolean); }",
+    Output(refresh_paused_id(MATCH), "data"),
+    Input(modal_id(MATCH, ALL), "is_open"),
+    prevent_initial_call=True,
+)
+
+
+# Dash doesn't allow MATCH in the inputs of a callback without outputs, the
+# sliders of the page are all inputs and only the ones that changed are sent.
+@callback(
+    Input(slider_id(ALL, ALL, ALL), "value"),
+    prevent_initial_call=True,
+)
+def slider_moved(values):
+    for trigger in callback_context.triggered:
+        slider = callback_context.triggered_prop_ids[trigger["prop_id"]]
+        handle_slider_change(
+            trigger["value"], slider["fx_type"], slider["fx_id"], slider["slider"]
+        )
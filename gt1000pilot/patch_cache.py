@@ -0,0 +1,42 @@
+from collections import OrderedDict
+import copy
+import threading
+
+# A patch is ~10KB of blocks, keep the last ones used and not the hundreds
+# of the unit.
+DEFAULT_MAX_PATCHES = 32
+
+
+class PatchCache:
+    """The blocks of the patches last used, least recently used evicted first"""
+
+    def __init__(self, max_patches=DEFAULT_MAX_PATCHES):
+        self.lock = threading.Lock()
+        self.max_patches = max_patches
+        # patch number -> {fx_type: blocks}
+        self.patches = OrderedDict()
+
+    def get(self, patch):
+        """Return a copy of the blocks known for patch, None if not cached"""
+        with self.lock:
+            if patch not in self.patches:
+                return None
+            self.patches.move_to_end(patch)
+            return copy.deepcopy(self.patches[patch])
+
+    def update(self, patch, fx_type, blocks):
+        with self.lock:
+            self.patches.setdefault(patch, {})[fx_type] = blocks
+            self.patches.move_to_end(patch)
+            while len(self.patches) > self.max_patches:
+                self.patches.popitem(last=False)
+
+    def export(self):
+        """Return a copy of the (patch, blocks) cached, least recently used
+        first"""
+        with self.lock:
+            return copy.deepcopy(list(self.patches.items()))
+
+    def clear(self):
+        with self.lock:
+            self.patches.clear()
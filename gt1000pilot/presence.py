@@ -0,0 +1,69 @@
+from collections import Counter
+import threading
+
+# How often the blocks of an fx_type are read from the unit when a client
+# shows its page, when clients only show other pages, and when no client is
+# connected at all. The unit reports its changes, this only catches the ones
+# we missed.
+VISIBLE_POLL_SEC = 10
+HIDDEN_POLL_SEC = 60
+HEARTBEAT_POLL_SEC = 300
+
+# Pages remembered for the clients without a stream open, a browser opens
+# its stream again by itself after a connection loss.
+MAX_DISCONNECTED_PAGES = 64
+
+
+class Presence:
+    """The clients connected to the dashboard and the page each one shows.
+
+    A client is connected while it has an event stream open, it reports the
+    fx_type of its page when the location changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # client_id -> number of event streams open
+        self.streams = Counter()
+        # client_id -> fx_type of the page shown
+        self.pages = {}
+
+    def connect(self, client_id):
+        with self.lock:
+            self.streams[client_id] += 1
+
+    def disconnect(self, client_id):
+        with self.lock:
+            self.streams[client_id] -= 1
+            if self.streams[client_id] <= 0:
+                del self.streams[client_id]
+            if len(self.pages) - len(self.streams) > MAX_DISCONNECTED_PAGES:
+                self.pages = {
+                    client_id: fx_type
+                    for client_id, fx_type in self.pages.items()
+                    if client_id in self.streams
+                }
+
+    def set_page(self, client_id, fx_type):
+        with self.lock:
+            self.pages[client_id] = fx_type
+
+    def client_count(self):
+        with self.lock:
+            return len(self.streams)
+
+    def visible_fx_types(self):
+        with self.lock:
+            return {
+                fx_type
+                for client_id, fx_type in self.pages.items()
+                if client_id in self.streams
+            }
+
+    def poll_interval(self, fx_type):
+        """How long the refresh thread can wait between two reads of fx_type"""
+        if self.client_count() == 0:
+            return HEARTBEAT_POLL_SEC
+        if fx_type in self.visible_fx_types():
+            return VISIBLE_POLL_SEC
+        return HIDDEN_POLL_SEC
@@ -0,0 +1,56 @@
+# Bytes of data returned for one RQ1, the unit never replies with more than
+# one page of 128 addresses in a single DT1.
+MAX_READ_SIZE = 128
+
+# Unused bytes we accept to read to merge two ranges instead of sending
+# another RQ1 and waiting for its reply.
+MAX_READ_GAP = 16
+
+# RQ1 sent before waiting for their replies. Most blocks have a page of
+# their own, pipelining the reads saves the round trips merging can't.
+MAX_READS_IN_FLIGHT = 8
+
+
+def plan_reads(addresses, max_size=MAX_READ_SIZE, max_gap=MAX_READ_GAP):
+    """Merge 7-bit packed addresses in (start, size) ranges read with one RQ1
+    each. A range never crosses a page, pages of the unit memory are not all
+    contiguous."""
+    ranges = []
+    for address in sorted(set(addresses)):
+        if ranges:
+            start, size = ranges[-1]
+            if (
+                address - (start + size) <= max_gap
+                and address - start < max_size
+                and address >> 7 == start >> 7
+            ):
+                ranges[-1] = (start, address - start + 1)
+                continue
+        ranges.append((address, 1))
+    return ranges
+
+
+class BulkRead:
+    """The bytes of an RQ1 range being received, the unit can send them in
+    several DT1"""
+
+    def __init__(self, start, size):
+        self.start = start
+        self.size = size
+        # 7-bit packed address -> byte
+        self.data = {}
+
+    def add(self, address, data):
+        """Keep the bytes of a DT1 in the range, return False if none are"""
+        kept = False
+        for i, byte in enumerate(data):
+            if self.start <= address + i < self.start + self.size:
+                self.data[address + i] = byte
+                kept = True
+        return kept
+
+    def complete(self):
+        return len(self.data) == self.size
+
+    def values(self):
+        return [self.data[self.start + i] for i in range(self.size)]
@@ -0,0 +1,47 @@
+from collections import defaultdict
+import threading
+
+
+def to_plain(value):
+    """The JSON structure Dash sends for a component tree, serializing it
+    again is much cheaper than walking the components"""
+    if hasattr(value, "to_plotly_json"):
+        value = value.to_plotly_json()
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    return value
+
+
+class RenderCache:
+    """Last rendering of each fx_type, shared by all the clients.
+
+    The blocks of a Snapshot never change, an entry is reused as long as
+    it is asked for the very blocks it was rendered from, and replaced by
+    the rendering of the next version.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # fx_type -> lock held while rendering it, clients asking for the
+        # same version at once wait for a single rendering
+        self.render_locks = defaultdict(threading.Lock)
+        # fx_type -> (blocks, rendering)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fx_type, blocks, render):
+        """Return render() for the blocks of fx_type, rendered once"""
+        with self.lock:
+            render_lock = self.render_locks[fx_type]
+        with render_lock:
+            entry = self.entries.get(fx_type)
+            if entry is not None and entry[0] is blocks:
+                self.hits += 1
+                return entry[1]
+            rendering = render()
+            self.entries[fx_type] = (blocks, rendering)
+            self.misses += 1
+            return rendering
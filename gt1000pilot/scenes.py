@@ -0,0 +1,183 @@
+import flask
+import json
+import logging
+import os
+import threading
+
+from gt1000pilot.api import FX_STATES, SLIDERS, compact_json
+from gt1000pilot.sysex import MAX_DATA_BYTE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Scenes:
+    """Named sets of block states, types and parameter values applied in one
+    batch, kept in a JSON file once load() is called.
+
+    A scene is a list of blocks like {"fx_type": "dist", "fx_id": 1,
+    "state": "ON", "type": "CLEAN BOOST", "params": {"LEVEL": 50}}, all the
+    keys but fx_type and fx_id are optional. The params are the options of
+    pygt1000, or slider1 and slider2 for the sliders shown.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        # name -> blocks of the scene
+        self.scenes = {}
+
+    def load(self, path):
+        """Use the scenes saved in path, and save them there from now on"""
+        with self.lock:
+            self.path = path
+            if not os.path.exists(path):
+                logger.info(f"No scenes in {path} yet")
+                return
+            with open(path) as f:
+                self.scenes = json.load(f)
+            logger.info(f"Loaded {len(self.scenes)} scenes from {path}")
+
+    def names(self):
+        with self.lock:
+            return sorted(self.scenes)
+
+    def get(self, name):
+        with self.lock:
+            return self.scenes.get(name)
+
+    def set(self, name, blocks):
+        with self.lock:
+            self.scenes[name] = blocks
+            self._save()
+
+    def delete(self, name):
+        """Return False if there is no scene called name"""
+        with self.lock:
+            if self.scenes.pop(name, None) is None:
+                return False
+            self._save()
+            return True
+
+    def _save(self):
+        if self.path is None:
+            return
+        # Don't leave a truncated file if we die while writing
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.scenes, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def scene_changes(blocks, gt1000, state_store, catalog):
+    """Return the writes of PilotGT1000.send_batch() and the changes of
+    StateStore.set_params() applying the blocks of a scene, raise ValueError
+    if they don't match the blocks of the unit or the pygt1000 tables"""
+    if not isinstance(blocks, list):
+        raise ValueError("A scene is a list of blocks")
+    writes = []
+    changes = []
+    for block in blocks:
+        if not isinstance(block, dict):
+            raise ValueError(f"Not a block: {block}")
+        fx_type = block.get("fx_type")
+        fx_id = block.get("fx_id")
+        if fx_type not in gt1000.fx_types:
+            raise ValueError(f"Unknown fx_type {fx_type}")
+        count = state_store.block_count(fx_type)
+        if not isinstance(fx_id, int) or not 1 <= fx_id <= count:
+            raise ValueError(f"Unknown block {fx_type}{fx_id}")
+        index = fx_id - 1
+        state = block.get("state")
+        if state is not None:
+            if state not in FX_STATES:
+                raise ValueError(f"Unknown state {state} for {fx_type}{fx_id}")
+            writes.append(("state", fx_type, fx_id, state))
+            changes.append((fx_type, index, "state", state))
+        new_type = block.get("type")
+        if new_type is not None:
+            if new_type not in catalog.fx_types(fx_type):
+                raise ValueError(f"Unknown type {new_type} for {fx_type}{fx_id}")
+            writes.append(("type", fx_type, fx_id, new_type))
+            changes.append((fx_type, index, "name", new_type))
+        params = block.get("params", {})
+        if not isinstance(params, dict):
+            raise ValueError(f"The params of {fx_type}{fx_id} are not a dict")
+        _, known = state_store.read(fx_type)
+        for param, value in params.items():
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"{param} of {fx_type}{fx_id} is not an int")
+            # The sliders change with the type, they are read again after it
+            sliders = [] if new_type is not None else SLIDERS
+            for slider in sliders:
+                slider_dict = known[index][slider]
+                if slider_dict is not None and param in [slider, slider_dict["label"]]:
+                    option = slider_dict["label"]
+                    break
+            else:
+                if param in SLIDERS:
+                    raise ValueError(f"No {param} for {fx_type}{fx_id}")
+                slider = None
+                option = param
+            # The options of the fx blocks are in the table of their new type
+            value_range = gt1000.option_range(fx_type, fx_id, option, new_type)
+            if value_range is None:
+                raise ValueError(f"No {param} for {fx_type}{fx_id}")
+            low, high = value_range
+            if not low <= value <= min(high, MAX_DATA_BYTE):
+                raise ValueError(f"{param} of {fx_type}{fx_id} out of range")
+            writes.append(("param", fx_type, fx_id, option, value))
+            if slider is not None:
+                changes.append(
+                    (fx_type, index, slider, {**slider_dict, "value": value})
+                )
+    return writes, changes
+
+
+def register_routes(server, scenes, gt1000, state_store, catalog):
+    """Applying a scene queues its writes as one batch and answers at once,
+    like the other POSTs of the API"""
+
+    def checked_scene(blocks):
+        try:
+            return scene_changes(blocks, gt1000, state_store, catalog)
+        except ValueError as error:
+            flask.abort(400, str(error))
+
+    @server.route("/api/scenes")
+    def get_scenes():
+        return compact_json({"scenes": scenes.names()})
+
+    @server.route("/api/scenes/<name>")
+    def get_scene(name):
+        blocks = scenes.get(name)
+        if blocks is None:
+            flask.abort(404, f"No scene {name}")
+        return compact_json({"name": name, "blocks": blocks})
+
+    @server.route("/api/scenes/<name>", methods=["PUT"])
+    def set_scene(name):
+        body = flask.request.get_json(silent=True)
+        if not isinstance(body, dict) or "blocks" not in body:
+            flask.abort(400, "Missing blocks")
+        checked_scene(body["blocks"])
+        logger.info(f"Saving scene {name}")
+        scenes.set(name, body["blocks"])
+        return "", 204
+
+    @server.route("/api/scenes/<name>", methods=["DELETE"])
+    def delete_scene(name):
+        if not scenes.delete(name):
+            flask.abort(404, f"No scene {name}")
+        return "", 204
+
+    @server.route("/api/scenes/<name>", methods=["POST"])
+    def apply_scene(name):
+        blocks = scenes.get(name)
+        if blocks is None:
+            flask.abort(404, f"No scene {name}")
+        writes, changes = checked_scene(blocks)
+        logger.info(f"Applying scene {name}, {len(writes)} writes")
+        gt1000.send_batch(writes)
+        state_store.set_params(changes)
+        return "", 204
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+import flask
+import gzip
+import logging
+import threading
+import waitress
+from waitress import wasyncore
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+HOST = "0.0.0.0"
+PORT = 8050
+
+SERVE_MODES = ["development", "production"]
+
+# Every client keeps a thread busy with its event stream, the callbacks and
+# the API need a few more.
+DEFAULT_THREADS = 16
+# Threads the event streams leave to the callbacks and the API
+RESERVED_THREADS = 4
+# Idle connections kept open for the next request of the browser
+DEFAULT_KEEP_ALIVE_SEC = 30
+# How long the shutdown waits for the requests in progress, the event
+# streams only end when their socket is closed.
+SHUTDOWN_TIMEOUT_SEC = 2
+
+# Compressing smaller responses costs more than it saves
+MIN_COMPRESS_SIZE = 500
+COMPRESS_LEVEL = 6
+COMPRESSED_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+}
+# The Dash bundles are the same for every client, keep them compressed
+MAX_COMPRESSED_BUNDLES = 64
+
+# Dash adds the modification time of the assets to their URLs and a
+# fingerprint to the URLs of its bundles, their content never changes.
+IMMUTABLE_MAX_AGE_SEC = 365 * 24 * 3600
+
+
+def register_compression(server):
+    """gzip the callback JSON and the text resources of server"""
+    # request path -> compressed body of the fingerprinted bundles
+    bundles = OrderedDict()
+    lock = threading.Lock()
+
+    @server.after_request
+    def compress(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSED_MIMETYPES
+            or "gzip" not in flask.request.accept_encodings
+        ):
+            return response
+        immutable = response.cache_control.immutable
+        with lock:
+            body = bundles.get(flask.request.full_path) if immutable else None
+        if body is None:
+            data = response.get_data()
+            if len(data) < MIN_COMPRESS_SIZE:
+                return response
+            body = gzip.compress(data, COMPRESS_LEVEL)
+            if immutable:
+                with lock:
+                    bundles[flask.request.full_path] = body
+                    while len(bundles) > MAX_COMPRESSED_BUNDLES:
+                        bundles.popitem(last=False)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        # Not the same bytes anymore
+        etag, weak = response.get_etag()
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+def register_cache_headers(app):
+    """Let the browsers keep the assets and the Dash bundles until their
+    URL changes"""
+    prefix = app.config.requests_pathname_prefix
+    assets_prefix = prefix + app.config.assets_url_path.strip("/") + "/"
+    bundles_prefix = prefix + "_dash-component-suites/"
+
+    # Before the compression, it keeps the immutable bundles compressed
+    @app.server.after_request
+    def cache_headers(response):
+        if response.status_code != 200:
+            return response
+        path = flask.request.path
+        if (path.startswith(assets_prefix) and "m" in flask.request.args) or (
+            path.startswith(bundles_prefix)
+            and response.cache_control.max_age == IMMUTABLE_MAX_AGE_SEC
+        ):
+            # Set by flask.send_file() for the assets
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE_SEC
+            response.cache_control.immutable = True
+        return response
+
+
+class Server:
+    """Serves the Dash app with the Flask development server, or with
+    waitress in the production mode"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mode = "development"
+        self.threads = DEFAULT_THREADS
+        self.keep_alive_sec = DEFAULT_KEEP_ALIVE_SEC
+        # (waitress server, its socket map) while run() serves with it
+        self.server = None
+
+    def configure(self, mode, threads=DEFAULT_THREADS, keep_alive_sec=None):
+        self.mode = mode
+        self.threads = threads
+        if keep_alive_sec is not None:
+            self.keep_alive_sec = keep_alive_sec
+
+    def max_streams(self):
+        """Event streams that can be open at once, None for no limit"""
+        if self.mode != "production":
+            # A thread per request
+            return None
+        return max(self.threads - RESERVED_THREADS, 1)
+
+    def run(self, app):
+        """Serve app until shutdown() or SIGINT"""
+        if self.mode != "production":
+            app.run_server(debug=False, host=HOST, port=PORT)
+            return
+        # Flask runs the after_request hooks in the reverse order
+        register_compression(app.server)
+        register_cache_headers(app)
+        socket_map = {}
+        server = waitress.create_server(
+            app.server,
+            map=socket_map,
+            host=HOST,
+            port=PORT,
+            threads=self.threads,
+            channel_timeout=self.keep_alive_sec,
+            ident="GT-1000PILOT",
+        )
+        with self.lock:
+            self.server = (server, socket_map)
+        logger.info(
+            f"Serving on http://{HOST}:{PORT} with {self.threads} threads (waitress)"
+        )
+        try:
+            server.run()
+        finally:
+            with self.lock:
+                self.server = None
+
+    def shutdown(self):
+        """Make run() return, False if it is not serving with waitress"""
+        with self.lock:
+            if self.server is None:
+                return False
+            server, socket_map = self.server
+        threading.Thread(
+            target=self._close, args=(server, socket_map), daemon=True
+        ).start()
+        return True
+
+    def _close(self, server, socket_map):
+        # Called from a request, the dispatcher waits for its threads
+        server.task_dispatcher.shutdown(timeout=SHUTDOWN_TIMEOUT_SEC)
+        # The loop of run() ends once its map is empty, close it from there
+        server.trigger.pull_trigger(lambda: wasyncore.close_all(socket_map))
@@ -1,28 +1,76 @@
-from pygt1000 import GT1000
+from gt1000pilot import startup
+from gt1000pilot.catalog import Catalog
+from gt1000pilot.device import PilotGT1000
+from gt1000pilot.midi_capture import MidiRecorder
+from gt1000pilot.presence import Presence
+from gt1000pilot.scenes import Scenes
+from gt1000pilot.serving import Server
+from gt1000pilot.state_cache import StateCache
+from gt1000pilot.snapshot import SnapshotRef
+from gt1000pilot.state_store import StateStore
+from gt1000pilot.write_queue import WriteQueue
 import logging
 
 
-menu_color1 = "#81ba7f"
-#menu_color2 = "#C1C9CB"
-# off_color = "#F2E9D8"
-off_color = "white"
-on_color = "#2D8C2A"
+# The colors of the blocks and links are in assets/style.css
 
 buttons_pc_height = 70
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-gt1000 = GT1000()
-gt1000.dash_effects = {}
+gt1000 = PilotGT1000()
+
+# Blocks shown by the dashboard, the callbacks read the current snapshot
+# without locking and replace it with a new one to change it.
+dash_effects = SnapshotRef()
+
+# Versioned copy of the state read by the refresh thread, its changes are
+# pushed to the browsers.
+state_store = StateStore()
+gt1000.add_state_listener(state_store.update)
+
+# The pages shown by the clients, the refresh thread reads the visible ones
+# more often and slows down when nobody is connected.
+presence = Presence()
+gt1000.poll_interval = presence.poll_interval
+
+
+def send_fx_value(key, value):
+    fx_type, fx_id, slider = key
+    label, value = value
+    gt1000.set_fx_value(fx_type, fx_id, label, value)
+    state_store.mark_written(fx_type, fx_id - 1, slider)
+
+
+# Slider values waiting to be sent, only the latest value of a drag is sent
+write_queue = WriteQueue(send_fx_value)
+
+# Effect types of each fx_type, served to the type selection modals
+catalog = Catalog(gt1000)
+
+# Named sets of block changes applied in one MIDI burst
+scenes = Scenes()
+
+# State of the last run, shown while the unit is read
+state_cache = StateCache(gt1000, catalog, state_store)
+
+# Logs the MIDI traffic when started from the command line, to replay it
+midi_recorder = MidiRecorder(gt1000)
+
+# Serves the dashboard, the serve mode is picked on the command line
+web_server = Server()
 
 # Mac and Linux default portname prefixes
 known_default_portname_prefixes = ["GT-1000", "GT-1000:GT-1000 MIDI 1"]
 
 
-def open_gt1000(in_portname=None, out_portname=None):
+def open_gt1000(in_portname=None, out_portname=None, simulator=None):
     opened = False
-    if in_portname is None or out_portname is None:
+    if simulator is not None:
+        if not gt1000.open_simulated_ports(simulator):
+            return False
+    elif in_portname is None or out_portname is None:
         portnames = known_default_portname_prefixes
         for portname in portnames:
             logger.info(f"Opening MIDI port {portname}")
@@ -35,6 +83,9 @@ def open_gt1000(in_portname=None, out_portname=None):
         logger.info(f"Opening MIDI ports {in_portname} / {out_portname}")
         if not gt1000.open_ports(in_portname=in_portname, out_portname=out_portname):
             return False
-    gt1000.refresh_state()
+    startup.phase("port open")
+    state_cache.unit_opened()
+    # The pages show a placeholder until the refresh thread reads their blocks
+    gt1000.queue_refresh({"type": "sync"})
     gt1000.start_refresh_thread()
     return True
@@ -0,0 +1,234 @@
+from pygt1000.constants import (
+    SYSEX_START,
+    SYSEX_END,
+    NON_RT_MSG,
+    GEN_INFO,
+    IDENTITY_REQUEST_MSG,
+    IDENTITY_REPLY,
+    MANUFACTURER_ID,
+    GT1000_FAMILY,
+    PROGRAM_CHANGE_OFFSET,
+)
+import heapq
+import logging
+import random
+import threading
+import time
+
+from gt1000pilot.sysex import (
+    RQ1,
+    DT1,
+    address_to_int,
+    int_to_address,
+    build_dt1,
+    parse_message,
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Software revision bytes reported in the identity reply
+MODELS = {
+    "GT-1000": (0x00, 0x01),
+    "GT-1000L": (0x01, 0x01),
+    "GT-1000CORE": (0x02, 0x00),
+}
+
+# The unit echoes the writes to the editor mode addresses
+EDITOR_MODE_MSB = 0x7F
+
+# Program Change on MIDI channel 1
+PROGRAM_CHANGE_STATUS = 0xC0
+
+# First byte of the temporary patch, the one swapped on program changes
+TEMPORARY_PATCH_MSB = 0x10
+
+
+class SimulatedMidiOut:
+    """The part of rtmidi.MidiOut used by pygt1000"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def send_message(self, message):
+        self.device.receive(list(message))
+
+    def close_port(self):
+        pass
+
+
+class SimulatedMidiIn:
+    """The part of rtmidi.MidiIn used by pygt1000"""
+
+    def __init__(self, device):
+        self.device = device
+        self.callback = None
+        self.data = None
+
+    def ignore_types(self, sysex=True, timing=True, active_sense=True):
+        pass
+
+    def set_callback(self, func, data=None):
+        self.callback = func
+        self.data = data
+
+    def close_port(self):
+        self.callback = None
+
+
+class SimulatedGT1000:
+    """In-memory GT-1000 answering the identity request, RQ1 reads and DT1
+    writes, with a configurable response latency and jitter"""
+
+    def __init__(self, model="GT-1000", device_id=0x10, latency_ms=0, jitter_ms=0):
+        self.model = model
+        self.device_id = device_id
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.random = random.Random()
+        # 7-bit packed address -> byte, unset addresses read as 0
+        self.memory = {}
+        # Temporary patch memory of the other programs
+        self.patches = {}
+        self.program = 0
+        self.received = 0
+        self.last_received_ts = None
+        self.sent = 0
+
+        self.midi_out = SimulatedMidiOut(self)
+        self.midi_in = SimulatedMidiIn(self)
+
+        # (due time, seq, message) replies waiting to be delivered
+        self.outbox = []
+        self.outbox_seq = 0
+        self.last_due = 0
+        self.cond = threading.Condition()
+        self.stop = False
+        self.thread = threading.Thread(target=self.deliver_thread, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        with self.cond:
+            self.stop = True
+            self.cond.notify_all()
+
+    def read(self, address, size):
+        start = address_to_int(address)
+        with self.cond:
+            return [self.memory.get(start + i, 0) for i in range(size)]
+
+    def write(self, address, data):
+        start = address_to_int(address)
+        with self.cond:
+            for i, byte in enumerate(data):
+                self.memory[start + i] = byte
+
+    def wait_received(self, count, timeout=None):
+        """Wait until count messages were received, return the
+        time.perf_counter() of the last one"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.received >= count, timeout):
+                return None
+            return self.last_received_ts
+
+    def receive(self, message):
+        """A message sent by the app"""
+        with self.cond:
+            self.received += 1
+            self.last_received_ts = time.perf_counter()
+            self.cond.notify_all()
+        if message == IDENTITY_REQUEST_MSG:
+            self.send(self.identity_reply())
+            return
+        parsed = parse_message(message)
+        if parsed is None:
+            logger.debug(f"Simulator ignored {message}")
+            return
+        command, device_id, address, data = parsed
+        if command == RQ1:
+            # Like the unit, reply with one DT1 per page of 128 addresses
+            start = address_to_int(address)
+            end = start + address_to_int(data[:4])
+            while start < end:
+                size = min(end, (start | 0x7F) + 1) - start
+                self.send(
+                    build_dt1(
+                        self.device_id,
+                        int_to_address(start),
+                        self.read(int_to_address(start), size),
+                    )
+                )
+                start += size
+        elif command == DT1:
+            self.write(address, data)
+            if address[0] == EDITOR_MODE_MSB:
+                self.send(build_dt1(self.device_id, address, data))
+
+    def identity_reply(self):
+        rev1, rev3 = MODELS[self.model]
+        return (
+            SYSEX_START
+            + NON_RT_MSG
+            + [self.device_id]
+            + GEN_INFO
+            + IDENTITY_REPLY
+            + MANUFACTURER_ID
+            + GT1000_FAMILY
+            + [0x00, 0x00, rev1, 0x00, rev3, 0x00]
+            + SYSEX_END
+        )
+
+    def unit_change(self, address, data):
+        """Simulate a change made on the unit itself, in editor mode the unit
+        reports it to the app"""
+        self.write(address, data)
+        self.send(build_dt1(self.device_id, address, data))
+
+    def program_change(self, program):
+        """Switch to another patch, the temporary patch memory of the
+        previous one is kept for when we come back to it"""
+        with self.cond:
+            current = {}
+            for address in list(self.memory):
+                if address >> 21 == TEMPORARY_PATCH_MSB:
+                    current[address] = self.memory.pop(address)
+            self.patches[self.program] = current
+            self.memory.update(self.patches.get(program, current))
+            self.program = program
+        self.send([PROGRAM_CHANGE_STATUS, program & 0x7F])
+        self.unit_change(PROGRAM_CHANGE_OFFSET, [program >> 7, program & 0x7F])
+
+    def send(self, message):
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(-self.jitter, self.jitter)
+        with self.cond:
+            # Like on a real MIDI cable, the jitter never reorders messages
+            self.last_due = max(time.monotonic() + delay, self.last_due)
+            self.outbox_seq += 1
+            heapq.heappush(self.outbox, (self.last_due, self.outbox_seq, message))
+            self.cond.notify_all()
+
+    def deliver_thread(self):
+        last = time.monotonic()
+        while True:
+            with self.cond:
+                while not self.stop:
+                    now = time.monotonic()
+                    if self.outbox and self.outbox[0][0] <= now:
+                        break
+                    timeout = self.outbox[0][0] - now if self.outbox else None
+                    self.cond.wait(timeout)
+                if self.stop:
+                    return
+                _, _, message = heapq.heappop(self.outbox)
+            callback = self.midi_in.callback
+            if callback is None:
+                continue
+            now = time.monotonic()
+            self.sent += 1
+            try:
+                callback((message, now - last), self.midi_in.data)
+            except Exception:
+                logger.exception("Simulator MIDI input callback failed")
+            last = now
@@ -0,0 +1,69 @@
+from types import MappingProxyType
+import threading
+
+
+def freeze(value):
+    """Read-only copy of a structure of dicts and lists"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class Snapshot:
+    """Immutable blocks of each fx_type as shown by the dashboard.
+
+    Changes return a new Snapshot sharing everything they don't touch with
+    this one, so a reader holding a Snapshot never sees a partial update.
+    """
+
+    __slots__ = ("effects", "versions")
+
+    def __init__(self, effects=None, versions=None):
+        # fx_type -> tuple of read-only blocks
+        self.effects = MappingProxyType(dict(effects or {}))
+        # fx_type -> seq of the state store its blocks were copied at
+        self.versions = MappingProxyType(dict(versions or {}))
+
+    def __contains__(self, fx_type):
+        return fx_type in self.effects
+
+    def blocks(self, fx_type):
+        return self.effects.get(fx_type, ())
+
+    def version(self, fx_type):
+        return self.versions.get(fx_type, -1)
+
+    def replace(self, fx_type, blocks, seq):
+        """New Snapshot with the blocks of fx_type copied at seq"""
+        if seq < self.version(fx_type):
+            return self
+        return Snapshot(
+            {**self.effects, fx_type: freeze(blocks)},
+            {**self.versions, fx_type: seq},
+        )
+
+    def update_block(self, fx_type, index, **changes):
+        """New Snapshot with changes applied to one block of fx_type"""
+        blocks = list(self.effects[fx_type])
+        blocks[index] = freeze({**blocks[index], **changes})
+        return Snapshot({**self.effects, fx_type: tuple(blocks)}, self.versions)
+
+
+class SnapshotRef:
+    """The current Snapshot, replaced as a whole on every change"""
+
+    def __init__(self):
+        self.current = Snapshot()
+        # Only serializes the writers, swapping the reference is atomic
+        self.lock = threading.Lock()
+
+    def get(self):
+        return self.current
+
+    def update(self, change):
+        """Replace the current Snapshot by change(current), return it"""
+        with self.lock:
+            self.current = change(self.current)
+            return self.current
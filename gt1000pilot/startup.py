@@ -0,0 +1,20 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Imported first by app.py, the phases are timed from here
+started = time.monotonic()
+
+# Phase name -> seconds after started
+phases = {}
+
+
+def phase(name):
+    """Log how long it took to reach the startup phase name, only the first
+    time it is reached"""
+    if name in phases:
+        return
+    phases[name] = time.monotonic() - started
+    logger.info(f"Startup: {name} after {phases[name]:.2f}s")
@@ -0,0 +1,125 @@
+from importlib import metadata
+import logging
+import marshal
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Start of the file, then the format version and the marshal version. A file
+# written with another version of either is ignored and replaced.
+MAGIC = b"GT1KPILOT"
+FORMAT_VERSION = 1
+HEADER = MAGIC + struct.pack("BB", FORMAT_VERSION, marshal.version)
+
+# Changes are saved at most this often, this is an SD card on a Pi
+SAVE_INTERVAL_SEC = 30
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "gt1000pilot", "state")
+
+
+def pygt1000_version():
+    try:
+        return metadata.version("pygt1000")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+class StateCache:
+    """The blocks of the last patches used and the effect catalogs, saved to
+    a file to show the dashboard right away on the next start.
+
+    The blocks only apply to the unit they were read from, the file keeps its
+    model and firmware and the blocks of another unit are dropped once it is
+    opened. The catalogs only depend on the tables of pygt1000. marshal loads
+    the dicts and lists of the file in a few milliseconds and can't run code
+    like pickle.
+    """
+
+    def __init__(self, gt1000, catalog, state_store, save_interval=SAVE_INTERVAL_SEC):
+        self.gt1000 = gt1000
+        self.catalog = catalog
+        self.state_store = state_store
+        self.save_interval = save_interval
+        self.path = None
+        # Model and firmware of the unit the loaded blocks were read from
+        self.loaded_identity = None
+
+    def start(self, path):
+        """Show the state saved in path, and save it there from now on"""
+        self.path = path
+        content = self.read()
+        if content is not None:
+            self.loaded_identity = content["identity"]
+            if content["pygt1000"] == pygt1000_version():
+                self.catalog.preload(content["catalogs"])
+            self.gt1000.load_patches(content["patches"], content["patch"])
+            logger.info(f"Loaded the state of {self.loaded_identity} from {path}")
+        threading.Thread(target=self.saver_thread, daemon=True).start()
+
+    def unit_opened(self):
+        """Drop the blocks loaded if they are from another unit"""
+        identity = self.gt1000.identity()
+        if self.loaded_identity is not None and self.loaded_identity != identity:
+            logger.info(f"Cached state is from {self.loaded_identity}, not {identity}")
+            self.gt1000.patch_cache.clear()
+        self.loaded_identity = None
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            logger.exception(f"Failed to read {self.path}")
+            return None
+        if not data.startswith(HEADER):
+            logger.info(f"Ignoring {self.path}, written by another version")
+            return None
+        try:
+            return marshal.loads(data[len(HEADER) :])
+        except (EOFError, ValueError, TypeError):
+            logger.warning(f"Ignoring {self.path}, corrupted")
+            return None
+
+    def content(self):
+        return {
+            "identity": self.gt1000.identity(),
+            "pygt1000": pygt1000_version(),
+            "catalogs": self.catalog.export(self.gt1000.fx_types),
+            "patch": self.gt1000.current_patch,
+            "patches": self.gt1000.patch_cache.export(),
+        }
+
+    def flush(self):
+        """Save the state if it was read from the unit, before exiting"""
+        if self.path is not None and self.gt1000.synced:
+            self.save()
+
+    def save(self):
+        # Don't leave a truncated file if we die while writing
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER + marshal.dumps(self.content()))
+        os.replace(tmp_path, self.path)
+
+    def saver_thread(self):
+        seq = 0
+        while True:
+            self.state_store.wait(seq)
+            # Let the changes of the next seconds go in the same write
+            time.sleep(self.save_interval)
+            # The blocks of a partial sync would replace a full state
+            if not self.gt1000.synced:
+                continue
+            seq = self.state_store.current_seq()
+            try:
+                self.save()
+            except Exception:
+                # Catch all to keep the thread alive
+                logger.exception(f"Failed to save the state to {self.path}")
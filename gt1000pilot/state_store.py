@@ -0,0 +1,172 @@
+from collections import deque
+from datetime import datetime
+import copy
+import threading
+
+# Parameters tracked for each block, as returned by pygt1000
+BLOCK_PARAMS = ["state", "name", "slider1", "slider2"]
+
+# How many changes we remember, clients further behind get a full refresh
+MAX_CHANGES = 4096
+
+
+class StateStore:
+    """Versioned copy of the known state of the unit.
+
+    Every change bumps a global sequence number, the sequence of the last
+    change is kept for each fx_type, block and parameter, and the recent
+    changes are logged so callers can ask what changed since the sequence
+    they last saw without walking the whole state.
+    """
+
+    def __init__(self, max_changes=MAX_CHANGES):
+        self.cond = threading.Condition()
+        self.seq = 0
+        # fx_type -> list of blocks
+        self.blocks = {}
+        # fx_type -> seq of its last change
+        self.fx_type_versions = {}
+        # fx_type -> [seq of the last change of each block]
+        self.block_versions = {}
+        # (fx_type, index, param) -> seq of its last change
+        self.param_versions = {}
+        # (seq, fx_type, index, param), oldest first
+        self.changes = deque(maxlen=max_changes)
+        # (fx_type, index, param) -> when the dashboard last changed it
+        self.pending_writes = {}
+        # fx_type -> how many of its blocks are ON, for the navigation bar
+        self.active_counts = {}
+
+    def _set(self, fx_type, index, param, value):
+        known = self.blocks[fx_type][index]
+        if param == "state":
+            self.active_counts[fx_type] += (value == "ON") - (known[param] == "ON")
+        known[param] = copy.deepcopy(value)
+        self._bump(fx_type, index, param)
+
+    def _bump(self, fx_type, index, param):
+        self.seq += 1
+        self.fx_type_versions[fx_type] = self.seq
+        self.block_versions[fx_type][index] = self.seq
+        self.param_versions[(fx_type, index, param)] = self.seq
+        self.changes.append((self.seq, fx_type, index, param))
+
+    def update(self, fx_type, blocks, read_ts=None):
+        """Merge the blocks read from the unit at read_ts, return how many
+        parameters changed"""
+        changed = 0
+        with self.cond:
+            if fx_type not in self.blocks or len(self.blocks[fx_type]) != len(blocks):
+                self.blocks[fx_type] = copy.deepcopy(blocks)
+                self.block_versions[fx_type] = [0] * len(blocks)
+                self.active_counts[fx_type] = len(
+                    [block for block in blocks if block["state"] == "ON"]
+                )
+                for index in range(len(blocks)):
+                    for param in BLOCK_PARAMS:
+                        self._bump(fx_type, index, param)
+                        changed += 1
+            else:
+                for index, block in enumerate(blocks):
+                    known = self.blocks[fx_type][index]
+                    for param in BLOCK_PARAMS:
+                        if known[param] == block[param]:
+                            continue
+                        # Don't revert a change made from the dashboard with
+                        # a value read before the unit received it.
+                        written = self.pending_writes.get((fx_type, index, param))
+                        if written is not None and read_ts is not None:
+                            if read_ts < written:
+                                continue
+                        self._set(fx_type, index, param, block[param])
+                        changed += 1
+            if changed:
+                self.cond.notify_all()
+        return changed
+
+    def set_param(self, fx_type, index, param, value):
+        """Record a change made from the dashboard before the unit confirms it"""
+        with self.cond:
+            self.pending_writes[(fx_type, index, param)] = datetime.now()
+            if self.blocks[fx_type][index][param] == value:
+                return
+            self._set(fx_type, index, param, value)
+            self.cond.notify_all()
+
+    def set_params(self, changes):
+        """set_param() for each (fx_type, index, param, value) of changes,
+        the clients are woken up once for all of them"""
+        with self.cond:
+            now = datetime.now()
+            changed = False
+            for fx_type, index, param, value in changes:
+                self.pending_writes[(fx_type, index, param)] = now
+                if self.blocks[fx_type][index][param] == value:
+                    continue
+                self._set(fx_type, index, param, value)
+                changed = True
+            if changed:
+                self.cond.notify_all()
+
+    def mark_written(self, fx_type, index, param):
+        """Record when a change queued by the dashboard was sent to the unit,
+        values read before that are still outdated"""
+        with self.cond:
+            self.pending_writes[(fx_type, index, param)] = datetime.now()
+
+    def read(self, fx_type):
+        """Return the current seq and a copy of the blocks of fx_type"""
+        with self.cond:
+            return self.seq, copy.deepcopy(self.blocks.get(fx_type, []))
+
+    def read_all(self):
+        """Return the current seq and a copy of the blocks of every fx_type"""
+        with self.cond:
+            return self.seq, copy.deepcopy(self.blocks)
+
+    def block_count(self, fx_type):
+        """How many blocks of fx_type are known, 0 before the first read"""
+        with self.cond:
+            return len(self.blocks.get(fx_type, []))
+
+    def current_seq(self):
+        with self.cond:
+            return self.seq
+
+    def versions(self, fx_type):
+        """Return the current seq and the seq of the last change of fx_type"""
+        with self.cond:
+            return self.seq, self.fx_type_versions.get(fx_type, 0)
+
+    def active_count(self, fx_type):
+        """How many blocks of fx_type are ON"""
+        with self.cond:
+            return self.active_counts.get(fx_type, 0)
+
+    def changes_since(self, since, fx_type=None, until=None):
+        """Return the (fx_type, index, param) changed after since, up to
+        until, or None if since is too old to be answered from the log"""
+        with self.cond:
+            if until is None:
+                until = self.seq
+            if self.changes and since < self.changes[0][0] - 1:
+                return None
+            changed = set()
+            for seq, change_fx_type, index, param in reversed(self.changes):
+                if seq <= since:
+                    break
+                if seq > until:
+                    continue
+                if fx_type is None or change_fx_type == fx_type:
+                    changed.add((change_fx_type, index, param))
+            return changed
+
+    def wait(self, since, timeout=None):
+        """Block until something changes after since, return the new seq and
+        the fx_types that changed"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > since, timeout)
+            fx_types = [
+                fx_type for fx_type, seq in self.fx_type_versions.items() if seq > since
+            ]
+            return self.seq, fx_types
@@ -0,0 +1,109 @@
+from pygt1000.constants import (
+    SYSEX_START,
+    SYSEX_END,
+    MANUFACTURER_ID,
+    MODEL_ID,
+    RQ1_COMMAND_ID,
+    DT1_COMMAND_ID,
+)
+
+# F0 41 <dev> 00 00 00 4F <cmd>
+HEADER_LEN = len(SYSEX_START + MANUFACTURER_ID) + 1 + len(MODEL_ID) + 1
+ADDRESS_LEN = 4
+
+RQ1 = RQ1_COMMAND_ID[0]
+DT1 = DT1_COMMAND_ID[0]
+
+# The data bytes of a SysEx message, above are the status bytes
+MAX_DATA_BYTE = 0x7F
+
+
+# Roland addresses and sizes are 4 bytes of 7 bits
+def address_to_int(address):
+    value = 0
+    for byte in address:
+        value = (value << 7) | byte
+    return value
+
+
+def int_to_address(value):
+    return [(value >> shift) & 0x7F for shift in (21, 14, 7, 0)]
+
+
+def checksum(data):
+    return (128 - sum(data) % 128) % 128
+
+
+def build_message(command, device_id, address, data):
+    payload = list(address) + list(data)
+    return (
+        SYSEX_START
+        + MANUFACTURER_ID
+        + [device_id]
+        + MODEL_ID
+        + [command]
+        + payload
+        + [checksum(payload)]
+        + SYSEX_END
+    )
+
+
+def build_dt1(device_id, address, data):
+    return build_message(DT1, device_id, address, data)
+
+
+def build_rq1(device_id, address, size):
+    return build_message(RQ1, device_id, address, int_to_address(size))
+
+
+def parse_message(message):
+    """Return (command, device_id, address, data) for a Roland RQ1/DT1
+    message of the GT-1000 family, None for anything else"""
+    if len(message) < HEADER_LEN + ADDRESS_LEN + 2:
+        return None
+    if message[0] != SYSEX_START[0] or message[-1] != SYSEX_END[0]:
+        return None
+    if message[1] != MANUFACTURER_ID[0] or list(message[3:7]) != MODEL_ID:
+        return None
+    command = message[7]
+    if command not in (RQ1, DT1):
+        return None
+    address = list(message[HEADER_LEN : HEADER_LEN + ADDRESS_LEN])
+    data = list(message[HEADER_LEN + ADDRESS_LEN : -2])
+    return command, message[2], address, data
+
+
+def merge_dt1(messages):
+    """Merge DT1 messages writing contiguous addresses of the same page in
+    one, the last value written to an address wins. Messages that are not
+    DT1 are kept first, in their order."""
+    others = []
+    # device_id -> 7-bit packed address -> byte
+    writes = {}
+    for message in messages:
+        parsed = parse_message(message)
+        if parsed is None or parsed[0] != DT1:
+            others.append(message)
+            continue
+        _, device_id, address, data = parsed
+        start = address_to_int(address)
+        device_writes = writes.setdefault(device_id, {})
+        for i, byte in enumerate(data):
+            device_writes[start + i] = byte
+    merged = []
+    for device_id, device_writes in writes.items():
+        runs = []
+        for address in sorted(device_writes):
+            start, data = runs[-1] if runs else (None, None)
+            if (
+                start is not None
+                and address == start + len(data)
+                and address >> 7 == start >> 7
+            ):
+                data.append(device_writes[address])
+            else:
+                runs.append((address, [device_writes[address]]))
+        merged += [
+            build_dt1(device_id, int_to_address(start), data) for start, data in runs
+        ]
+    return others + merged
@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Dragging a slider fires far more events than the unit needs, a DT1 is
+# about 15 bytes so this leaves plenty of room on a 31250 baud MIDI link.
+DEFAULT_MAX_RATE = 30
+
+
+def min_interval(max_rate):
+    if max_rate <= 0:
+        raise ValueError(f"The write rate must be positive, not {max_rate}")
+    return 1 / max_rate
+
+
+class WriteQueue:
+    """Parameter writes waiting to be sent to the unit.
+
+    Writes are keyed by (fx_type, fx_id, param), a new value for a key
+    still waiting replaces the old one so only the latest value of a
+    slider drag is sent. A dedicated thread sends them in the order the
+    keys were first queued, at most max_rate messages per second.
+    """
+
+    def __init__(self, send, max_rate=DEFAULT_MAX_RATE):
+        self.send = send
+        self.cond = threading.Condition()
+        # key -> latest value
+        self.pending = OrderedDict()
+        self.min_interval = min_interval(max_rate)
+        self.last_sent = 0
+        # How many values were replaced before being sent
+        self.coalesced = 0
+        self.sent = 0
+        self.thread = threading.Thread(target=self.sender_thread, daemon=True)
+        self.thread.start()
+
+    def set_max_rate(self, max_rate):
+        with self.cond:
+            self.min_interval = min_interval(max_rate)
+            self.cond.notify_all()
+
+    def put(self, key, value):
+        with self.cond:
+            if key in self.pending:
+                self.coalesced += 1
+            self.pending[key] = value
+            self.cond.notify_all()
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending)
+
+    def sender_thread(self):
+        while True:
+            with self.cond:
+                while True:
+                    now = time.monotonic()
+                    if not self.pending:
+                        self.cond.wait()
+                    elif now < self.last_sent + self.min_interval:
+                        self.cond.wait(self.last_sent + self.min_interval - now)
+                    else:
+                        break
+                key, value = self.pending.popitem(last=False)
+                self.last_sent = now
+            try:
+                self.send(key, value)
+                with self.cond:
+                    self.sent += 1
+            except Exception:
+                # Catch all to keep the thread alive
+                logger.exception(f"Failed to send {key}: {value}")